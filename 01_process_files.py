@@ -8,7 +8,8 @@ import sys
 import argparse
 
 # Own scripts
-import bogen
+import evalhelper_processing as pr
+import evalhelper_instrumentation as ins
 
 
 if __name__ == "__main__":
@@ -16,32 +17,105 @@ if __name__ == "__main__":
     # get path to boegen files
     parser = argparse.ArgumentParser(description="Get file path.")
     parser.add_argument("-i", "--input", type=str)
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Number of worker processes.")
+    parser.add_argument("-m", "--method", type=str, default="vectorized",
+                        choices=["vectorized", "pyramid", "bruteforce"],
+                        help="Search method of the masks.")
+    parser.add_argument("--margin", type=int, default=0,
+                        help="Enlarge the search windows by MARGIN pixels.")
+    parser.add_argument("--radius", type=int, default=None,
+                        help="Search the masks within RADIUS pixels of their "
+                        "position on the recent boegen first.")
+    parser.add_argument("--min-confidence", type=float, default=0.8,
+                        help="Search the full window below this match "
+                        "confidence (with --radius).")
+    parser.add_argument("--fit", type=str, default="lstsq",
+                        choices=["lstsq", "ransac", "nelder-mead"],
+                        help="Fit of the transformation.")
+    parser.add_argument("--inlier-threshold", type=float, default=3.,
+                        help="Maximum residual of the inliers of --fit "
+                        "ransac (pixels).")
+    parser.add_argument("--max-residual", type=float, default=None,
+                        help="Reject boegen with larger residuals (pixels).")
+    parser.add_argument("--max-pages", type=int, default=None,
+                        help="Decoded pages resident at once per process.")
+    parser.add_argument("--prefetch", type=int, default=2,
+                        help="Pages decoded in advance (without workers).")
+    parser.add_argument("--shard", type=str, default=None,
+                        help="Process only shard i/N of the boegen, e.g. "
+                        "1/4, merge the results with merge_shards.py.")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Process all boegen, also unchanged ones.")
+    parser.add_argument("--timings", type=str, default=None,
+                        help="Write timings as JSON lines to TIMINGS.")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Save cProfile stats to PROFILE.")
     parser_args = parser.parse_args()
+    if parser_args.max_pages is not None and parser_args.max_pages < 1:
+        parser.error("--max-pages must be at least 1")
+    if parser_args.timings or parser_args.profile:
+        ins.enable(parser_args.timings, parser_args.profile)
     path_to_boegen = parser_args.input
     if path_to_boegen is None:
         print("Error: Correct use of the script see below.")
-        print("    python process_files.py -i <PathToBoegenFiles>")
+        print("    python process_files.py -i <PathToBoegenFiles>"
+              " [-w <NumberOfWorkers>]")
         sys.exit(0)
 
     # DO NOT CHANGE THE reference file: "boegen/Bogen3.jpg"
     reference_file = path_to_boegen + "/Bogen3.jpg"
 
+    options = {"method": parser_args.method,
+               "searchMargin": parser_args.margin,
+               "searchRadius": parser_args.radius,
+               "minConfidence": parser_args.min_confidence,
+               "fitMethod": parser_args.fit,
+               "inlierThreshold": parser_args.inlier_threshold,
+               "maxResidual": parser_args.max_residual}
+
     # reference points of the reference file (bogen3)
     # -> position of masks/corners
-    referenceBogen = bogen.Bogen(curr_file=reference_file,
-                                 ref_points=None,
-                                 ref_boxes=None,
-                                 isReference=True)
-    refPoints = referenceBogen.ReferencePoints
-    refBoxPositions = referenceBogen.ReferenceBoxes
+    # -> cached in boxes/reference.json, analysed again if anything changed
+    refPoints, refBoxPositions = pr.loadReference(reference_file, options)
 
     path_to_iterate = path_to_boegen + "/*.jpg"
-    nfiles = len(glob.glob(path_to_iterate))
-    for i, current_file in enumerate(glob.glob(path_to_iterate)):
+    allfiles = glob.glob(path_to_iterate)
+
+    # only the boegen of this shard, by a hash of the file name
+    # -> separate manifest and results, see merge_shards.py
+    shard = None
+    manifestfile, resultfile = pr.MANIFEST, pr.RESULTS
+    if parser_args.shard is not None:
+        shard = pr.parseShard(parser_args.shard)
+        allfiles = [f for f in allfiles
+                    if pr.getShard(f, shard[1]) == shard[0]]
+        manifestfile = pr.getShardPath(pr.MANIFEST, *shard)
+        resultfile = pr.getShardPath(pr.RESULTS, *shard)
+    manifest = pr.Manifest(pr.getLayoutVersion(reference_file, options),
+                           manifestfile)
+
+    # skip boegen that did not change since the last run
+    # -> all are processed again if reference, layout or options changed
+    files = allfiles
+    if not parser_args.force:
+        files = manifest.getPending(files)
+    print("Processing", len(files), "of", len(allfiles), "boegen.")
+
+    results = pr.processFiles(files, refPoints, refBoxPositions,
+                              workers=parser_args.workers, options=options,
+                              manifest=manifest,
+                              maxPages=parser_args.max_pages,
+                              prefetch=parser_args.prefetch)
+
+    # badly registered boegen
+    rejected = [r["file"] for r in results if r["rejected"]]
+    if rejected:
+        print("Rejected", len(rejected), "boegen:", ", ".join(rejected))
 
-        curr_bogen = bogen.Bogen(curr_file=current_file, ref_points=refPoints,
-                                 ref_boxes=refBoxPositions, isReference=False)
+    # results of all boegen, also of the skipped ones
+    pr.saveResults(allfiles, manifest, resultfile, shard)
+    print("Saved results to", resultfile)
 
-        # show progress
-        print("Progress: ", round((i + 1) / nfiles * 100, 2),
-              "(", current_file, ")")
+    # print timings if enabled
+    ins.finish()
@@ -2,23 +2,93 @@
 
 """Evaluation helper part 2 - train neural network."""
 
-import pickle
+import argparse
 
 # Own scripts
 import evalhelper_dataloader as dl
 import evalhelper_nn as nn
+import evalhelper_parallel as par
+import evalhelper_instrumentation as ins
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Train neural network.")
+    parser.add_argument("-e", "--epochs", type=int, default=3,
+                        help="Maximum number of epochs.")
+    parser.add_argument("--eta", type=float, default=0.1,
+                        help="Learning rate of the first epoch.")
+    parser.add_argument("--decay", type=float, default=1.,
+                        help="Factor of the learning rate per epoch.")
+    parser.add_argument("--patience", type=int, default=None,
+                        help="Stop if the test accuracy did not improve for "
+                        "PATIENCE epochs.")
+    parser.add_argument("--min-delta", type=float, default=0.,
+                        help="Minimum improvement of the test accuracy "
+                        "(0-1).")
+    parser.add_argument("--eval-sample", type=float, default=None,
+                        help="Fraction of the test data evaluated after each "
+                        "epoch (0-1), all of it after the last epoch.")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                        help="Save a checkpoint after every epoch.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the training of the checkpoint.")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Train with several worker processes.")
+    parser.add_argument("--hogwild", action="store_true",
+                        help="Workers update the weights without locks "
+                        "(faster, not reproducible).")
+    parser.add_argument("--sync-every", type=int, default=1,
+                        help="Mini batches per worker between two "
+                        "synchronizations of the weights.")
+    parser.add_argument("--timings", type=str, default=None,
+                        help="Write timings as JSON lines to TIMINGS.")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Save cProfile stats to PROFILE.")
+    parser_args = parser.parse_args()
+    if parser_args.resume and parser_args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if parser_args.timings or parser_args.profile:
+        ins.enable(parser_args.timings, parser_args.profile)
+
     # load training data
     # data needs to be in same folder as script
     trainingdata, testdata = dl.loaddata()
 
     # actual training of the NN
     evalnn = nn.Network([1600, 2])
-    evalnn.SGD(trainingdata, testdata)
+    evalnn.epochs = parser_args.epochs
+    evalnn.eta = parser_args.eta
+    options = {"test_data": testdata,
+               "checkpoint": parser_args.checkpoint,
+               "resume": parser_args.resume,
+               "patience": parser_args.patience,
+               "minDelta": parser_args.min_delta,
+               "schedule": nn.exponentialSchedule(parser_args.eta,
+                                                  parser_args.decay),
+               "sample": parser_args.eval_sample}
+    if parser_args.workers > 1:
+        # -> mini batches distributed over the workers, they map the cached
+        #    training data from disk, see evalhelper_parallel
+        par.SGD(evalnn, trainingdata, workers=parser_args.workers,
+                mode="hogwild" if parser_args.hogwild else "sync",
+                syncEvery=parser_args.sync_every, **options)
+    else:
+        # -> shuffled mini batches are streamed from the cache on disk
+        evalnn.SGD(trainingdata.stream(evalnn.mini_batchsize), **options)
+
+    # check that reduced precisions (03_eval_nn.py --precision) do not
+    # change any classification of the test data
+    for precision in ["float32", "int8"]:
+        check = evalnn.comparePrecision(testdata, precision)
+        print("Precision", precision, "-> accuracy",
+              round(check["accuracy"]*100, 2), "% (float64",
+              round(check["accuracy_float64"]*100, 2), "%),",
+              check["changed"], "changed classifications")
+
+    # save weights, see evalhelper_nn.saveNetwork
+    nn.saveNetwork(evalnn, nn.WEIGHTS)
+    print("Saved neural network to", nn.WEIGHTS)
 
-    # save nn via pickle
-    pickle.dump(evalnn, open("nn_object.p", "wb"))
-    print("Saved neural network to file.")
+    # print timings if enabled
+    ins.finish()
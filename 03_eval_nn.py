@@ -2,19 +2,52 @@
 
 """Evaluation helper part 3 - evaluate neural network."""
 
+import os
+import glob
 import pickle
+import argparse
 import numpy as np
-import glob
 
 # Own scripts
+import bogen
 import evalhelper_dataloader as dl
+import evalhelper_nn as nn
+import evalhelper_pipeline as pl
+import evalhelper_processing as pr
 import evalhelper_statistics as st
+import evalhelper_instrumentation as ins
+import evalhelper_prefetch as pf
 
 
 if __name__ == "__main__":
 
-    # load trained neural network
-    evalnn = pickle.load(open("nn_object.p", "rb"))
+    parser = argparse.ArgumentParser(description="Evaluate boegen.")
+    parser.add_argument("-i", "--input", type=str, default=None,
+                        help="Evaluate the scanned boegen of INPUT in "
+                        "memory, without the boxes of 01_process_files.py.")
+    parser.add_argument("--prefetch", type=int, default=2,
+                        help="Boegen loaded in advance.")
+    parser.add_argument("--precision", type=str, default="float64",
+                        choices=["float64", "float32", "int8"],
+                        help="Precision of the neural network, see the "
+                        "check of 02_train_nn.py.")
+    parser.add_argument("--timings", type=str, default=None,
+                        help="Write timings as JSON lines to TIMINGS.")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Save cProfile stats to PROFILE.")
+    parser_args = parser.parse_args()
+    if parser_args.timings or parser_args.profile:
+        ins.enable(parser_args.timings, parser_args.profile)
+
+    # load trained neural network, weights are mapped into memory
+    # -> networks pickled by older versions are converted once
+    if not os.path.exists(nn.WEIGHTS) and os.path.exists("nn_object.p"):
+        nn.saveNetwork(pickle.load(open("nn_object.p", "rb")), nn.WEIGHTS)
+        print("Converted nn_object.p to", nn.WEIGHTS)
+    evalnn = nn.loadNetwork(nn.WEIGHTS)
+    evalnn.setPrecision(parser_args.precision)
+    # reduced precisions work on uint8 pixels
+    scaled = parser_args.precision == "float64"
 
     # manual check of one question
     # test_box = np.reshape(np.array(
@@ -22,40 +55,56 @@ if __name__ == "__main__":
     #     (1600,1))
     # print(evalnn.crossed(test_box))
 
-    # current path of box pictures
-    path = "boxes/Bogen"
-
-    nfiles = len(glob.glob(path + "*"))
-    nquestions = 14
-    nanswers = 5
-
-    # global summary -> 28 boegen, 14 questions each
-    summarystats = np.zeros(shape=(nfiles, nquestions), dtype=int)
-
-    # loop through all boegen
-    for bogen in range(nfiles):
-
-        # load bogen to be evaluated
-        bogendata = dl.loadbogen(path + str(bogen+1))
-
-        # evaluate each of the 5 boxes, crossed or not
-        evaluated = np.zeros(shape=(nquestions, nanswers, 1), dtype=float)
-
-        # for each of the 14 questions, indicated which answer/box is crossed
-        # -> number between 0-4
-        summary = np.zeros(shape=(nquestions,), dtype=int)
-
-        for j in range(nquestions):
-            for i in range(nanswers):
-
-                # see if single box is crossed or not
-                evaluated[j][i] = evalnn.crossed(np.reshape(bogendata[j][i],
-                                                            (1600, 1)))
-            # summary -> which of the boxes to one question is crossed
-            summary[j] = np.argmax(evaluated[j])
-
-        # save in global summary -> each row contains all answers of one bogen
-        summarystats[bogen] = summary
+    if parser_args.input is not None:
+        # scan to answers in memory, see evalhelper_pipeline.evaluateScan
+        # -> default search of 01_process_files.py, same cached reference
+        options = {"method": "vectorized", "searchMargin": 0}
+        refPoints, refBoxPositions = pr.loadReference(
+            parser_args.input + "/Bogen3.jpg", options)
+        files = sorted(glob.glob(parser_args.input + "/*.jpg"))
+        prefetcher = pf.Prefetcher(bogen.loadPage, files,
+                                   parser_args.prefetch)
+        summaries = [pl.evaluateScan(f, refPoints, refBoxPositions, evalnn,
+                                     page=page, **options)
+                     for f, page in prefetcher]
+        prefetcher.report()
+        # rejected boegen are left out
+        summarystats = np.array([s for s in summaries if s is not None],
+                                dtype=int).reshape(-1, 14)
+    else:
+        # box folders of all processed boegen, see getbogenfolders
+        # -> independent of the numbering of the boegen
+        folders = dl.getbogenfolders()
+
+        nfiles = len(folders)
+        nquestions = 14
+
+        # global summary -> all boegen, 14 questions each
+        summarystats = np.zeros(shape=(nfiles, nquestions), dtype=int)
+
+        # number of boegen that are evaluated at once
+        batchsize = 100
+
+        # boegen are loaded in background threads while a batch is evaluated
+        prefetcher = pf.Prefetcher(lambda path: dl.loadbogen(path, scaled),
+                                   folders, parser_args.prefetch)
+        loaded = iter(prefetcher)
+
+        # loop through all boegen in batches
+        for start in range(0, nfiles, batchsize):
+            stop = min(start + batchsize, nfiles)
+
+            # load boegen to be evaluated
+            bogendata = np.stack([next(loaded)[1]
+                                  for k in range(start, stop)])
+
+            # for each of the 14 questions, indicated which answer/box is
+            # crossed -> each row contains all answers of one bogen
+            summarystats[start:stop] = pl.answersFromBoxes(evalnn, bogendata)
+        prefetcher.report()
 
     # evaluate and print summary
     st.printStats(summarystats)
+
+    # print timings if enabled
+    ins.finish()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""Evaluation helper - benchmark of all stages."""
+
+# Standard libraries
+import os
+import shutil
+import argparse
+import tempfile
+
+# Own scripts
+import evalhelper_benchmark as bm
+import evalhelper_synthetic as sy
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark all stages.")
+    parser.add_argument("-d", "--data", type=str, default=None,
+                        help="Folder with boegen/, masks/ and crosses/, "
+                        "default is a synthetic workspace.")
+    parser.add_argument("-n", "--forms", type=int, default=20,
+                        help="Number of synthetic boegen.")
+    parser.add_argument("-s", "--samples", type=int, default=2000,
+                        help="Number of synthetic training pictures.")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Number of runs per stage.")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Save results as JSON.")
+    parser.add_argument("-b", "--baseline", type=str, default=None,
+                        help="Compare with results saved before.")
+    parser.add_argument("-k", "--keep", action="store_true",
+                        help="Keep the synthetic workspace.")
+    parser_args = parser.parse_args()
+
+    workdir = parser_args.data
+    temporary = workdir is None
+    if temporary:
+        workdir = tempfile.mkdtemp(prefix="evalhelper_benchmark_")
+        print("Creating synthetic workspace in", workdir)
+    try:
+        if temporary:
+            sy.generate(workdir, parser_args.forms, parser_args.samples)
+        results = bm.runBenchmarks(os.path.abspath(workdir),
+                                   parser_args.repeat)
+    finally:
+        # synthetic boegen and thousands of training pictures
+        if temporary and not parser_args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif temporary:
+            print("Kept synthetic workspace in", workdir)
+
+    if parser_args.output is not None:
+        bm.saveResults(results, parser_args.output)
+        print("Saved results to", parser_args.output)
+    if parser_args.baseline is not None:
+        bm.compareResults(results, parser_args.baseline)
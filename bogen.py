@@ -1,42 +1,237 @@
 """Evaluation helper - Bogen class."""
 import os
 import csv
+import itertools
+import threading
 import numpy as np
 from PIL import Image, ImageDraw
 from scipy.optimize import minimize
 from scipy.linalg import norm
 
+# Own scripts
+import evalhelper_matching as mt
+import evalhelper_geometry as gm
+import evalhelper_instrumentation as ins
+
+
+class PageBudget(object):
+    """Limit of the decoded pages that are resident at once."""
+
+    def __init__(self, maxPages=None):
+        """Initialize budget.
+
+        Parameters
+        ----------
+        maxPages : int, optional
+            Maximum number of pages (at least 1), None for no limit
+
+        """
+        if maxPages is not None and maxPages < 1:
+            raise ValueError("maxPages must be at least 1: %s" % maxPages)
+        self.maxPages = maxPages
+        self.semaphore = None
+        if maxPages is not None:
+            self.semaphore = threading.BoundedSemaphore(maxPages)
+        # ids of the pages handed out by loadPage
+        self.pages = set()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until another page may be decoded."""
+        if self.semaphore is not None:
+            with ins.timer("page_wait"):
+                self.semaphore.acquire()
+
+    def add(self, page):
+        """Count a decoded page until it is released."""
+        with self.lock:
+            self.pages.add(id(page))
+
+    def release(self, page=None):
+        """Give back a page of loadPage, other or released pages are ignored.
+
+        Parameters
+        ----------
+        page : ndarray, optional
+            Page to be released, None if its decoding failed
+
+        """
+        if page is not None:
+            with self.lock:
+                if id(page) not in self.pages:
+                    return
+                self.pages.remove(id(page))
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+
+# budget of the current process, see setPageBudget
+_budget = PageBudget()
+
+
+def setPageBudget(maxPages=None):
+    """Limit the decoded pages that are resident in the current process.
+
+    Parameters
+    ----------
+    maxPages : int, optional
+        Maximum number of pages (at least 1), None for no limit
+
+    """
+    global _budget
+    _budget = PageBudget(maxPages)
+
+
+def loadPage(path):
+    """Decode a page into a greyscale array.
+
+    The page counts against the page budget of the process until the
+    bogen it is passed to releases it, see Bogen.releasePage.
+
+    Parameters
+    ----------
+    path : str
+        Path to the scanned bogen
+
+    Returns
+    -------
+    page : ndarray
+        Page as 2D uint8 array (rows = y, columns = x)
+
+    """
+    budget = _budget
+    budget.acquire()
+    try:
+        with ins.timer("decode"):
+            with Image.open(path) as image:
+                if image.mode != "L":
+                    image = image.convert("L")
+                page = np.asarray(image)
+    except BaseException:
+        budget.release()
+        raise
+    budget.add(page)
+    return page
+
+
 class Bogen(object):
     """Class of Bogen for every file to be evaluated."""
 
-    def __init__(self, curr_file, ref_points, ref_boxes, isReference=False):
-        """Initialization."""
+    def __init__(self, curr_file, ref_points, ref_boxes, isReference=False,
+                 method="vectorized", searchMargin=0, saveBoxes=True,
+                 fitMethod="lstsq", maxResidual=None, searchRadius=None,
+                 minConfidence=0.8, inlierThreshold=3., page=None):
+        """Initialization.
+
+        Parameters
+        ----------
+        curr_file : str
+            Path to the bogen
+        ref_points : list of lists
+            Reference points of the reference file
+        ref_boxes : dict
+            Positions of all boxes of the reference file
+        isReference : bool, optional
+            True if the current file is the reference file
+        method : str, optional
+            Mask search, "vectorized", "pyramid" or "bruteforce"
+        searchMargin : int, optional
+            Pixels by which the search windows of the masks are enlarged
+        saveBoxes : bool, optional
+            Write the boxes as PNGs to self.outputDir, see extractBoxes
+        fitMethod : str, optional
+            Fit of the transformation, "lstsq", "ransac" or "nelder-mead"
+        maxResidual : float, optional
+            Reject the bogen (no boxes are extracted) if a reference point
+            deviates more than maxResidual pixels from the fit
+        searchRadius : int, optional
+            Search every mask in a window of +-searchRadius pixels around
+            its running position estimate of the recent boegen first, the
+            full window is only searched if this fails (not "bruteforce")
+        minConfidence : float, optional
+            Minimum match confidence in the tight window, only confident
+            matches update the running estimate
+        inlierThreshold : float, optional
+            Maximum residual in pixels of the inliers of fitMethod "ransac"
+        page : ndarray, optional
+            Page decoded in advance by loadPage, e.g. in a background
+            thread, the file is not read again
+
+        """
         self.RefPosPath = "reference_positions.csv"
-        self.image = Image.open(curr_file)
+        self.MaskPosPath = "mask_positions.csv"
         self.curr_file = curr_file
+        self.pageArray = page
+        self.method = method
+        self.searchMargin = searchMargin
+        self.saveBoxes = saveBoxes
+        self.fitMethod = fitMethod
+        self.maxResidual = maxResidual
+        self.searchRadius = searchRadius
+        self.minConfidence = minConfidence
+        self.inlierThreshold = inlierThreshold
+        self.MatchScores = []
+        self.Residuals = None
+        self.Rejected = False
+        self.BoxData = None
+        self.outputDir = self.getOutputDir()
+
+        with ins.timer("form", file=curr_file):
+            try:
+                self.getPageArray()
+                if isReference is False:
+                    self.processFile(ref_points, ref_boxes)
+                else:
+                    with ins.timer("mask_search"):
+                        self.ReferencePoints = self.findReferenceMasks()
+                    self.ReferenceBoxes = self.getRefPositions()
+            finally:
+                # only the boxes are kept, the page is loaded again on demand
+                self.releasePage()
+
+    def processFile(self, ref_points, ref_boxes):
+        """Find masks, transform the boxes and extract them.
+
+        Parameters
+        ----------
+        ref_points : list of lists
+            Reference points of the reference file
+        ref_boxes : dict
+            Positions of all boxes of the reference file
 
-        if isReference is False:
-            self.ReferencePoints = ref_points
+        """
+        ins.count("forms")
+        self.ReferencePoints = ref_points
+        with ins.timer("mask_search"):
             self.CurrReferencePoints = self.findReferenceMasks()
 
-            # positions of all boxes of the reference file
-            self.ReferenceBoxes = ref_boxes
-            self.CurrBoxes = ref_boxes
+        # positions of all boxes of the reference file
+        # copy, the reference positions are shared between all boegen
+        self.ReferenceBoxes = ref_boxes
+        self.CurrBoxes = {c: list(v) for c, v in ref_boxes.items()}
 
-            # get transformation matrix
+        # get transformation matrix
+        with ins.timer("affine_fit"):
             self.transMatrix = self.getTransformationMatrix()
+            self.Residuals = self.getResiduals()
+
+        # reject badly registered boegen
+        if (self.maxResidual is not None and
+                max(self.Residuals) > self.maxResidual):
+            self.Rejected = True
+            ins.count("rejected")
+            print("Rejected:", self.curr_file, "residuals",
+                  np.round(self.Residuals, 2))
+            return
 
-            # transform points
-            self.PointsTransformed = False
+        # transform points
+        self.PointsTransformed = False
+        with ins.timer("transform"):
             self.transformPositions()
 
-            # save boxes to file
-            self.extractBoxes()
-
-        else:
-            self.curr_file = curr_file
-            self.ReferencePoints = self.findReferenceMasks()
-            self.ReferenceBoxes = self.getRefPositions()
+        # boxes as array, optionally saved to file
+        with ins.timer("box_extraction"):
+            self.BoxData = self.extractBoxes()
 
     def findReferenceMasks(self):
         """Find positions of the corners (see masks).
@@ -54,36 +249,82 @@ class Bogen(object):
             Positions [x,y] of the reference points (corners).
 
         """
-        # mask upper left
-        mask_ul = Image.open("masks/ul.png")
-        pos_ul = self.findPosition(mask_ul, x1=30, x2=110, y1=650,
-                                   y2=730, xoff=52, yoff=52)
-
-        # mask upper middle
-        mask_um = Image.open("masks/ul.png")
-        pos_um = self.findPosition(mask_um, x1=1070, x2=1150, y1=340,
-                                   y2=430, xoff=52, yoff=52)
-
-        # mask upper right
-        mask_ur = Image.open("masks/ur.png")
-        pos_ur = self.findPosition(mask_ur, x1=2300, x2=2400, y1=350,
-                                   y2=430, xoff=54, yoff=59)
-
-        # mask lower left
-        mask_ll = Image.open("masks/ll.png")
-        pos_ll = self.findPosition(mask_ll, x1=30, x2=110, y1=2720,
-                                   y2=2791, xoff=52, yoff=36)
-
-        # mask lower right
-        mask_lr = Image.open("masks/lr.png")
-        pos_lr = self.findPosition(mask_lr, x1=2300, x2=2400, y1=2710,
-                                   y2=2789, xoff=51, yoff=54)
-
-        return pos_ul, pos_um, pos_ur, pos_ll, pos_lr
-
-    def findPosition(self, mask, x1, x2, y1, y2, xoff, yoff):
-        """Find position of a mask in a specific window."""
-        mask_px = mask.load()
+        # confidence of all matches, see findPosition
+        self.MatchScores = []
+
+        # masks and search windows, see mask_positions.csv
+        bank = mt.getTemplateBank(self.MaskPosPath)
+        return tuple(self.findPosition(template) for template in bank)
+
+    def findPosition(self, template, method=None):
+        """Find position of a mask in its search window.
+
+        The match confidence (normalized cross-correlation) is appended to
+        self.MatchScores.
+
+        Parameters
+        ----------
+        template : evalhelper_matching.Template
+            Mask to be searched with its search window
+        method : str, optional
+            "vectorized" scores the whole window in one pass, "pyramid"
+            searches coarse-to-fine, "bruteforce" compares every candidate
+            pixel by pixel. Default is self.method.
+
+        Returns
+        -------
+        pos : list of int
+            Position [x,y] of the mask
+
+        """
+        if method is None:
+            method = self.method
+
+        mask_arr = template.array
+        page = self.getPageArray()
+        x1, x2, y1, y2 = template.x1, template.x2, template.y1, template.y2
+
+        # enlarge search window, but keep the mask on the page
+        if self.searchMargin:
+            x1 = max(x1 - self.searchMargin, 0)
+            y1 = max(y1 - self.searchMargin, 0)
+            x2 = max(min(x2 + self.searchMargin, page.shape[1] - 35), x1 + 1)
+            y2 = max(min(y2 + self.searchMargin, page.shape[0] - 35), y1 + 1)
+
+        # tight window around the position on the recent boegen first
+        adaptive = self.searchRadius is not None and method != "bruteforce"
+        pos, score = None, None
+        if adaptive and template.prior is not None:
+            pos, score = mt.matchTemplatePrior(page, template, x1, x2, y1, y2,
+                                               self.searchRadius,
+                                               self.minConfidence)
+            if pos is None:
+                ins.count("prior_misses")
+
+        # full window
+        if pos is None:
+            if method == "bruteforce":
+                pos = self.findPositionBruteForce(mask_arr, x1, x2, y1, y2,
+                                                  template.xoff,
+                                                  template.yoff)
+            elif method == "pyramid":
+                pos, mse_min = mt.matchTemplatePyramid(page, mask_arr,
+                                                       x1, x2, y1, y2)
+            else:
+                pos, mse_min = mt.matchTemplate(page, mask_arr, x1, x2, y1,
+                                                y2, template.sumsq)
+            score = mt.getConfidence(page, mask_arr, pos, template.centered,
+                                     template.norm)
+
+        self.MatchScores.append(score)
+        if adaptive and score >= self.minConfidence:
+            template.updatePrior(pos)
+        return pos
+
+    def findPositionBruteForce(self, mask, x1, x2, y1, y2, xoff, yoff):
+        """Find position of a mask in a specific window pixel by pixel."""
+        mask_px = Image.fromarray(mask).load()
+        image = Image.fromarray(self.getPageArray())
         pos = [0, 0]
         mse_min = 999999
 
@@ -91,7 +332,7 @@ class Bogen(object):
         for x in range(x1, x2):
             for y in range(y1, y2):
                 # extract rectangular on which corner is searched
-                px = self.image.crop([x, y, x+xoff, y+yoff]).load()
+                px = image.crop([x, y, x+xoff, y+yoff]).load()
 
                 # calculate mean squared error between the two cropped images
                 mse_curr = self.getMSEBetweenTwoImages(mask_px, px)
@@ -104,6 +345,27 @@ class Bogen(object):
         # print(mse_min, pos)
         return pos
 
+    def getPageArray(self):
+        """Get the page as greyscale array, decoded only once.
+
+        The decoded image itself is not kept, see loadPage.
+
+        Returns
+        -------
+        pageArray : ndarray
+            Page as 2D uint8 array (rows = y, columns = x)
+
+        """
+        if self.pageArray is None:
+            self.pageArray = loadPage(self.curr_file)
+        return self.pageArray
+
+    def releasePage(self):
+        """Free the page array, see getPageArray."""
+        if self.pageArray is not None:
+            _budget.release(self.pageArray)
+            self.pageArray = None
+
     def getMSEBetweenTwoImages(self, im1, im2, x_max=36, y_max=36):
         """Calculate mean squared error (MSE) between two images pixel-wise.
 
@@ -127,15 +389,17 @@ class Bogen(object):
                 mse += (im1[i, j] - im2[i, j])**2
         return mse/(y_max*x_max)
 
-    def getTransformationMatrix(self):
+    def getTransformationMatrix(self, method=None):
         """Get transformation matrix between reference and new file.
 
         Parameters
         ----------
-        refPoints : list of lists
-            Reference points of reference file
-        newPoints : list of lists
-            Reference points of current file
+        method : str, optional
+            "lstsq" solves the linear least squares problem directly,
+            "ransac" fits all 3-point subsets and refits on the inliers
+            (residual <= self.inlierThreshold) of the best one,
+            "nelder-mead" minimizes the squared error numerically. Default
+            is self.fitMethod.
 
         Returns
         -------
@@ -143,6 +407,29 @@ class Bogen(object):
             Matrix A and vector b of the linear transformation
 
         """
+        if method is None:
+            method = self.fitMethod
+
+        refPoints = np.array(self.ReferencePoints, dtype=float)
+        newPoints = np.array(self.CurrReferencePoints, dtype=float)
+
+        if method == "lstsq":
+            return self.fitAffine(refPoints, newPoints)
+
+        elif method == "ransac":
+            # all minimal subsets, deterministic for 5 points
+            best = None
+            for subset in itertools.combinations(range(len(refPoints)), 3):
+                subset = list(subset)
+                x = self.fitAffine(refPoints[subset], newPoints[subset])
+                res = self.getResiduals(x)
+                inliers = res <= self.inlierThreshold
+                # most inliers, then smallest error of the inliers
+                score = (np.sum(inliers), -np.sum(res[inliers]**2))
+                if best is None or score > best[0]:
+                    best = (score, inliers)
+            return self.fitAffine(refPoints[best[1]], newPoints[best[1]])
+
         def errFunc(x):
             A = x[:4].reshape(2, 2)
             b = x[4:]
@@ -156,6 +443,47 @@ class Bogen(object):
         # print("transMatrix = ", res.x)
         return res.x
 
+    def fitAffine(self, refPoints, newPoints):
+        """Least squares fit of newPoints = A * refPoints + b.
+
+        Parameters
+        ----------
+        refPoints, newPoints : ndarray
+            Corresponding points, shape (n, 2) with n >= 3
+
+        Returns
+        -------
+        ndarray
+            Matrix A (row by row) and vector b, 6 values
+
+        """
+        # one row [x, y, 1] per point -> solves for A^T and b together
+        design = np.hstack([refPoints, np.ones(shape=(len(refPoints), 1))])
+        sol = np.linalg.lstsq(design, newPoints, rcond=None)[0]
+        return np.concatenate([sol[:2].T.ravel(), sol[2]])
+
+    def getResiduals(self, transMatrix=None):
+        """Distance between transformed reference points and found points.
+
+        Parameters
+        ----------
+        transMatrix : ndarray, optional
+            Matrix A and vector b, default self.transMatrix
+
+        Returns
+        -------
+        ndarray
+            Residual in pixels for each reference point
+
+        """
+        if transMatrix is None:
+            transMatrix = self.transMatrix
+        A = transMatrix[:4].reshape(2, 2)
+        b = transMatrix[4:]
+        diff = (np.dot(np.array(self.ReferencePoints, dtype=float), A.T) + b -
+                np.array(self.CurrReferencePoints, dtype=float))
+        return np.sqrt(np.sum(diff**2, axis=1))
+
     def transformPositions(self):
         """Get new box positions of file.
 
@@ -178,20 +506,17 @@ class Bogen(object):
             print("Points already transformed.")
             return
 
-        # transform point for point
-        for i in range(len(self.ReferenceBoxes["x0"])):
-            pointUL = [self.ReferenceBoxes["x0"][i],
-                       self.ReferenceBoxes["y0"][i]]
-            newPointUL = self.transformPoint(pointUL)
+        # transform all corners at once
+        nboxes = len(self.ReferenceBoxes["x0"])
+        refBoxes = self.ReferenceBoxes
+        points = np.column_stack([refBoxes["x0"] + refBoxes["x1"],
+                                  refBoxes["y0"] + refBoxes["y1"]])
+        newPoints = gm.transformPoints(self.transMatrix, points)
 
-            pointLR = [self.ReferenceBoxes["x1"][i],
-                       self.ReferenceBoxes["y1"][i]]
-            newPointLR = self.transformPoint(pointLR)
-
-            self.CurrBoxes["x0"][i] = newPointUL[0]
-            self.CurrBoxes["y0"][i] = newPointUL[1]
-            self.CurrBoxes["x1"][i] = newPointLR[0]
-            self.CurrBoxes["y1"][i] = newPointLR[1]
+        self.CurrBoxes["x0"] = list(newPoints[:nboxes, 0])
+        self.CurrBoxes["y0"] = list(newPoints[:nboxes, 1])
+        self.CurrBoxes["x1"] = list(newPoints[nboxes:, 0])
+        self.CurrBoxes["y1"] = list(newPoints[nboxes:, 1])
 
         self.PointsTransformed = True
 
@@ -217,49 +542,59 @@ class Bogen(object):
     def extractBoxes(self):
         """Extract boxes from current file.
 
-        Parameters
-        ----------
-        refpos : dict
-            Dictionary of all reference positions
-        path : str
-            Path to file
+        The boxes are written as PNGs to self.outputDir only if
+        self.saveBoxes is True.
 
         Returns
         -------
-        images : png
-            Boxes as images
+        storage : ndarray
+            All 14 questions with 5 boxes each, shape (14, 5, 1600) float32
+            pixels scaled to 0-1, same layout as dataloader.loadbogen
 
         """
-        # loop for rectangles
-        for i in range(len(self.CurrBoxes["x0"]) - 4):
+        nboxes = len(self.CurrBoxes["x0"]) - 4
 
-            # get corner points
-            corners = [self.CurrBoxes["x0"][i]-10, self.CurrBoxes["y0"][i]-10,
-                       self.CurrBoxes["x1"][i]+10, self.CurrBoxes["y1"][i]+10]
+        # corner points of all rectangles
+        corners = np.column_stack([self.CurrBoxes["x0"][:nboxes],
+                                   self.CurrBoxes["y0"][:nboxes],
+                                   self.CurrBoxes["x1"][:nboxes],
+                                   self.CurrBoxes["y1"][:nboxes]])
+        corners += [-10, -10, 10, 10]
 
-            # cut box out of image
-            box = self.image.crop(corners)
+        # cut boxes out of image and resize to 40x40 images, all at once
+        boxes = gm.extractBoxes(self.getPageArray(), corners)
 
-            # resize to 40x40 image
-            box = box.resize((40, 40))
+        if self.saveBoxes:
+            # check if folder exists
+            if not os.path.exists(self.outputDir):
+                os.makedirs(self.outputDir)
 
-            # iterative folder
-            # necessary as glob.glob has a kind of random sorting
-            path = self.curr_file
-            folder = path[path.find("/Bogen")+1:path.find(".")]
+            # save as images with iterative names
+            with ins.timer("png_write"):
+                for i, box in enumerate(boxes):
+                    Image.fromarray(box).save(
+                        self.outputDir + "/box" + str(i) + ".png")
+            ins.count("png_files", len(boxes))
 
-            # path and folder
-            directory = "boxes/" + folder
+        # greyscale value (0-255) for each pixel (scaled to 0-1)
+        storage = boxes.reshape(nboxes // 5, 5, 1600) / float(255)
+        return storage.astype(np.float32)
 
-            # check if folder exists
-            if not os.path.exists(directory):
-                os.makedirs(directory)
+    def getOutputDir(self):
+        """Get folder for the boxes of the current file.
 
-            # iterative name
-            name = "box" + str(i)
+        Returns
+        -------
+        directory : str
+            Folder, e.g. "boxes/Bogen5" for "boegen/Bogen5.jpg"
+
+        """
+        # name of the file without extension
+        # -> independent of the order of the files
+        folder = os.path.splitext(os.path.basename(self.curr_file))[0]
 
-            # save as image
-            box.save(directory + "/" + name + ".png")
+        # path and folder
+        return "boxes/" + folder
 
     def getRefPositions(self):
         """Get reference positions from CSV file.
@@ -295,7 +630,8 @@ class Bogen(object):
             Path to file
 
         """
-        draw = ImageDraw.Draw(self.image)
+        image = Image.open(self.curr_file)
+        draw = ImageDraw.Draw(image)
         for i in range(len(self.CurrReferencePoints["x0"])):
             box = [self.CurrReferencePoints["x0"][i],
                    self.CurrReferencePoints["y0"][i],
@@ -0,0 +1,197 @@
+"""Evaluation helper - benchmarks of the scan, train and eval stages."""
+import os
+import glob
+import json
+import time
+import shutil
+import tempfile
+import platform
+import resource
+import tracemalloc
+import numpy as np
+
+# Own scripts
+import bogen
+import evalhelper_dataloader as dl
+import evalhelper_nn as nn
+import evalhelper_pipeline as pl
+import evalhelper_synthetic as sy
+
+
+def measure(func, repeat=3):
+    """Run a function several times, measure time and memory.
+
+    Parameters
+    ----------
+    func : callable
+        Function without arguments
+    repeat : int, optional
+        Number of runs, the fastest one is reported
+
+    Returns
+    -------
+    (seconds, peak_mb, result) : tuple
+        Fastest runtime, peak traced memory in MB and last return value
+
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    # separate run for the memory, tracing slows down the function
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 2.**20, result
+
+
+def runBenchmarks(workdir, repeat=3):
+    """Run all stage benchmarks and the full pipeline benchmark.
+
+    Parameters
+    ----------
+    workdir : str
+        Folder with boegen/, masks/, crosses/ and reference_positions.csv,
+        e.g. created by evalhelper_synthetic.generate
+    repeat : int, optional
+        Number of runs per stage
+
+    Returns
+    -------
+    results : dict
+        Seconds, throughput and peak memory of every stage
+
+    """
+    cwd = os.getcwd()
+    # the training set is cached in a temporary folder, the cache of the
+    # workdir is left alone
+    cachedir = tempfile.mkdtemp(prefix="evalhelper_cache_")
+    os.chdir(workdir)
+    try:
+        return _runBenchmarks(repeat, os.path.join(cachedir, "cache"))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(cachedir, ignore_errors=True)
+
+
+def _runBenchmarks(repeat, cachedir):
+    """Run all benchmarks in the current folder, see runBenchmarks."""
+    results = {}
+    files = sorted(glob.glob("boegen/*.jpg"))
+
+    def report(stage, seconds, peak, count, unit):
+        results[stage] = {"seconds": seconds, "throughput": count / seconds,
+                          "unit": unit, "peak_mb": peak}
+        print("%-16s %10.4f s %12.1f %-10s %8.1f MB" %
+              (stage, seconds, count / seconds, unit, peak))
+
+    # scan stages on the reference and one bogen
+    ref = bogen.Bogen("boegen/Bogen3.jpg", None, None, isReference=True)
+    form = bogen.Bogen([f for f in files if "Bogen3" not in f][0],
+                       ref.ReferencePoints, ref.ReferenceBoxes,
+                       saveBoxes=False)
+    # the page is released after the extraction -> decode it once again
+    form.getPageArray()
+
+    seconds, peak, _ = measure(form.findReferenceMasks, repeat)
+    report("mask_search", seconds, peak, 1, "forms/s")
+
+    seconds, peak, _ = measure(form.getTransformationMatrix, repeat)
+    report("affine_fit", seconds, peak, 1, "forms/s")
+
+    def extract():
+        form.PointsTransformed = False
+        form.transformPositions()
+        return form.extractBoxes()
+    seconds, peak, _ = measure(extract, repeat)
+    report("box_extraction", seconds, peak, 1, "forms/s")
+
+    # training stages
+    def load():
+        shutil.rmtree(cachedir, ignore_errors=True)
+        return dl.loaddata(cachedir)
+    seconds, peak, (training, test) = measure(load, 1)
+    nsamples = len(training) + len(test)
+    report("dataset_build", seconds, peak, nsamples, "samples/s")
+    seconds, peak, (training, test) = measure(lambda: dl.loaddata(cachedir),
+                                              repeat)
+    report("dataset_load", seconds, peak, nsamples, "samples/s")
+
+    evalnn = nn.Network([1600, 2])
+    seconds, peak, _ = measure(lambda: evalnn.update_epoch(training), repeat)
+    report("train_epoch", seconds, peak, len(training), "samples/s")
+
+    # inference of all boxes of the test set
+    x_test = test.matrices()[0].T
+    seconds, peak, _ = measure(lambda: evalnn.predict_batch(x_test), repeat)
+    report("batch_inference", seconds, peak, len(test), "samples/s")
+
+    # registration error of the synthetic boegen
+    if os.path.exists("truth.json"):
+        with open("truth.json") as f:
+            truth = json.load(f)
+        errors = [np.max(sy.getBoxErrors(
+            bogen.Bogen(path, ref.ReferencePoints, ref.ReferenceBoxes,
+                        saveBoxes=False),
+            truth["layout"], entry["transMatrix"]))
+            for path, entry in sorted(truth["boegen"].items())]
+        results["box_error_px"] = {"max": float(np.max(errors)),
+                                   "mean": float(np.mean(errors))}
+        print("%-16s %10.2f px max %8.2f px mean" %
+              ("box_error", np.max(errors), np.mean(errors)))
+
+    # full pipeline, scan to answers
+    def pipeline():
+        return [pl.evaluateScan(f, ref.ReferencePoints, ref.ReferenceBoxes,
+                                evalnn) for f in files]
+    seconds, peak, _ = measure(pipeline, 1)
+    report("pipeline", seconds, peak, len(files), "forms/s")
+
+    return results
+
+
+def saveResults(results, path):
+    """Save benchmark results with some information on the system.
+
+    Parameters
+    ----------
+    results : dict
+        Results of runBenchmarks
+    path : str
+        JSON file
+
+    """
+    data = {"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "max_rss_mb": resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024.,
+            "stages": results}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def compareResults(results, path):
+    """Print the speedup of every stage compared to a stored baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results of runBenchmarks
+    path : str
+        JSON file saved by saveResults
+
+    """
+    with open(path) as f:
+        baseline = json.load(f)["stages"]
+    print("\nStage            Baseline (s)  Current (s)  Speedup")
+    for stage, result in results.items():
+        if stage not in baseline or "seconds" not in result:
+            continue
+        print("%-16s %12.4f %12.4f %8.2fx" %
+              (stage, baseline[stage]["seconds"], result["seconds"],
+               baseline[stage]["seconds"] / result["seconds"]))
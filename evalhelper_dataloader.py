@@ -1,79 +1,330 @@
 """Evaluation helper - dataloader for NN."""
+import os
+import sys
 import glob
+import json
 import random
+import hashlib
 import numpy as np
 from PIL import Image
 
+# Own scripts
+import evalhelper_instrumentation as ins
+
 # print the entire array independent of its size
-np.set_printoptions(threshold=np.nan)
+np.set_printoptions(threshold=sys.maxsize)
 
+# folder of the cached training set, see loadcache
+CACHEDIR = "crosses_cache"
+
+
+class CrossSet(object):
+    """Lazy view on the cached boxes, behaves like a list of (x,y) tuples.
+
+    Pixels are stored as uint8 and only converted to float when accessed.
+
+    """
+
+    def __init__(self, pixels, labels, indices):
+        """Constructor.
+
+        Parameters
+        ----------
+        pixels : ndarray
+            uint8 pixels of all boxes, shape (n, 1600), may be a memmap
+        labels : ndarray
+            1 for crossed, 0 for empty, shape (n,)
+        indices : ndarray
+            rows of pixels/labels that belong to this set
+
+        """
+        self.pixels = pixels
+        self.labels = labels
+        self.indices = np.asarray(indices)
+
+    def __len__(self):
+        """Number of boxes in the set."""
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        """Get a (x,y) tuple for an int, or a new CrossSet for a slice."""
+        if isinstance(key, (int, np.integer)):
+            x, y = self.matrices(self.indices[key:key+1])
+            return (x, y)
+        return CrossSet(self.pixels, self.labels, self.indices[key])
+
+    def __iter__(self):
+        """Iterate over (x,y) tuples."""
+        for k in range(len(self)):
+            yield self[k]
+
+    def shuffle(self):
+        """Shuffle the set in place with the random module."""
+        random.shuffle(self.indices)
+
+    def stream(self, batchsize=50, chunksize=10000):
+        """Get the set as a stream of shuffled mini batches.
+
+        Parameters
+        ----------
+        batchsize : int, optional
+            number of boxes per mini batch
+        chunksize : int, optional
+            number of boxes read from disk at once
+
+        Returns
+        -------
+        stream : BatchStream
+            reshuffled every time it is iterated
+
+        """
+        return BatchStream(self, batchsize, chunksize)
+
+    def matrices(self, indices=None, scaled=True):
+        """Get the boxes as matrices, one column per box.
+
+        Parameters
+        ----------
+        indices : ndarray, optional
+            rows to be returned, default all rows of the set
+        scaled : bool, optional
+            pixels scaled to 0-1, otherwise uint8 pixels 0-255
+
+        Returns
+        -------
+        (x, y) : tuple of ndarray
+            x = 1600xm pixels scaled to 0-1,
+            y = 2xm desired output, crossed is (0,1), uncrossed is (1,0)
+
+        """
+        if indices is None:
+            indices = self.indices
+        x = self.pixels[indices].T
+        if scaled:
+            x = x / float(255)
+        y = np.zeros(shape=(2, len(indices)), dtype=float)
+        y[self.labels[indices], np.arange(len(indices))] = 1
+        return (x, y)
 
-def loaddata():
-    """ Load training and test data.
+
+class BatchStream(object):
+    """Shuffled mini batches of a CrossSet, read from disk in chunks.
+
+    Only the shuffled index and one chunk of uint8 pixels are held in
+    memory, independent of the size of the memory-mapped set.
+
+    """
+
+    def __init__(self, crossset, batchsize=50, chunksize=10000):
+        """Constructor.
+
+        Parameters
+        ----------
+        crossset : CrossSet
+            set to be streamed
+        batchsize : int, optional
+            number of boxes per mini batch
+        chunksize : int, optional
+            number of boxes read from disk at once, multiple of batchsize
+
+        """
+        self.crossset = crossset
+        self.batchsize = batchsize
+        self.chunksize = max(chunksize // batchsize, 1) * batchsize
+
+    def __iter__(self):
+        """Yield (x,y) mini batches, one column per box, of one epoch."""
+        indices = np.array(self.crossset.indices)
+        random.shuffle(indices)
+        for start in range(0, len(indices), self.chunksize):
+            chunk = indices[start:start+self.chunksize]
+            # read the chunk in file order, then restore the shuffled order
+            order = np.argsort(chunk)
+            chunkset = CrossSet(self.crossset.pixels[chunk[order]],
+                                self.crossset.labels[chunk[order]],
+                                np.argsort(order))
+            for k in range(0, len(chunk), self.batchsize):
+                yield chunkset[k:k+self.batchsize].matrices()
+
+
+def getfiles():
+    """Get the pathnames of all training pictures.
+
+    Returns
+    -------
+    (crossed_files, empty_files) : tuple of lists
+        sorted pathnames of crossed and empty boxes
+
+    """
+    crossed_files = sorted(glob.glob("crosses/work_type_crossed/*.png"))
+    empty_files = sorted(glob.glob("crosses/work_type_empty/*.png"))
+    return (crossed_files, empty_files)
+
+
+def getcachekey(files):
+    """Hash of file list, modification times and sizes.
 
     Parameters
     ----------
-    None : None
+    files : list of str
+        pathnames of all pictures
 
     Returns
     -------
-    (training_data, test_data) : list of tuples
-        tuple pairs with ndarrays for in and output
+    key : str
+        hex digest, changes if any picture is added, removed or modified
+
     """
-    # number of data -> 27449
-    nrd = 5573 + 21867
-    # split : training vs test
-    trdata_nrd = int(round(nrd*0.75))
-    # trdata_nrd = nrd - 10001
+    sha = hashlib.sha1()
+    for f in files:
+        stat = os.stat(f)
+        sha.update(("%s\t%d\t%d\n" % (f, stat.st_mtime_ns,
+                                        stat.st_size)).encode())
+    return sha.hexdigest()
+
 
-    # storage of data, nrd rows and 1600 columns (pixels)
-    storage = np.zeros(shape=(nrd, 1600), dtype=float)
+def loadcache(cachedir=CACHEDIR):
+    """Load the cached training set, rebuild it if the pictures changed.
 
-    # list of pathnames for all pictures
-    crossed_files = glob.glob("crosses/work_type_crossed/*.png")
-    empty_files = glob.glob("crosses/work_type_empty/*.png")
+    Parameters
+    ----------
+    cachedir : str, optional
+        folder of the cache
+
+    Returns
+    -------
+    (pixels, labels) : tuple of ndarray
+        pixels = memory-mapped uint8 array, shape (n, 1600),
+        labels = 1 for crossed, 0 for empty, shape (n,)
+
+    """
+    crossed_files, empty_files = getfiles()
     files = crossed_files + empty_files
+    key = getcachekey(files)
+
+    pixelfile = os.path.join(cachedir, "pixels.npy")
+    labelfile = os.path.join(cachedir, "labels.npy")
+    keyfile = os.path.join(cachedir, "key.txt")
+
+    # rebuild cache if it is missing or outdated
+    if not os.path.exists(keyfile) or open(keyfile).read() != key:
+        with ins.timer("cache_build"):
+            buildcache(files, len(crossed_files), cachedir)
+        # key is written last -> an interrupted build is rebuilt
+        with open(keyfile, "w") as f:
+            f.write(key)
+
+    return (np.load(pixelfile, mmap_mode="r"), np.load(labelfile))
+
+
+def buildcache(files, ncrossed, cachedir=CACHEDIR):
+    """Write pixels and labels of the training pictures to the cache.
+
+    Parameters
+    ----------
+    files : list of str
+        pathnames of all pictures, crossed ones first
+    ncrossed : int
+        number of crossed pictures
+    cachedir : str, optional
+        folder of the cache
+
+    """
+    pixelfile = os.path.join(cachedir, "pixels.npy")
+    labelfile = os.path.join(cachedir, "labels.npy")
+    keyfile = os.path.join(cachedir, "key.txt")
+
+    # the key of an old cache is removed first
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir)
+    if os.path.exists(keyfile):
+        os.remove(keyfile)
+
+    # write pixels directly to disk, one picture after the other
+    pixels = np.lib.format.open_memmap(
+        pixelfile, mode="w+", dtype=np.uint8, shape=(len(files), 1600))
+    for counter, f in enumerate(files):
+        # convert greyscale & get value (0-255) for each pixel
+        pixels[counter] = np.asarray(
+            Image.open(f).convert('L')).reshape(1600)
+    pixels.flush()
+    del pixels
+    ins.count("cached_pictures", len(files))
+
+    # crossed vs empty
+    labels = np.zeros(shape=(len(files),), dtype=np.uint8)
+    labels[:ncrossed] = 1
+    np.save(labelfile, labels)
+
+
+def loaddata(cachedir=CACHEDIR):
+    """ Load training and test data.
+
+    Parameters
+    ----------
+    cachedir : str, optional
+        folder of the cache, see loadcache
+
+    Returns
+    -------
+    (training_data, test_data) : tuple of CrossSet
+        behave like lists of tuples (x,y) whereas
+        x = 1600x1 np.array,
+        y = 2x1 np.array
+    """
+    with ins.timer("dataset_load"):
+        pixels, labels = loadcache(cachedir)
+    nrd = len(labels)
+    # split : training vs test
+    trdata_nrd = int(round(nrd*0.75))
 
-    # loop through all
-    for counter in range(len(files)):
-        # convert greyscale & get value (0-255) for each pixel (scaled to 0-1)
-        cur_px = np.array(
-            Image.open(files[counter]).convert('L').getdata()) / float(255)
-        # save in storage
-        storage[counter] = cur_px
-
-    # crossed vs empty -> desired output values
-    yvalues = np.zeros(shape=(nrd, 2), dtype=float)
-    for j in range(nrd):
-        if j <= 5573:
-            # crossed is (0,1) vector
-            yvalues[j] = np.array([0, 1])
-        else:
-            # uncrossed is (1,0) vector
-            yvalues[j] = np.array([1, 0])
-
-    # return as list of tuples (x,y) whereas
-    # x = 1600x1 np.array,
-    # y = 2x1 np.array
-    dataset = [(np.reshape(s, (1600, 1)), np.reshape(y, (2, 1)))
-               for s, y in zip(storage, yvalues)]
     # shuffle before split with fixed seed
+    indices = np.arange(nrd)
     random.seed(1)
-    random.shuffle(dataset)
+    random.shuffle(indices)
     # split into training and test data
-    training_data = dataset[:trdata_nrd]
-    test_data = dataset[trdata_nrd:]
+    training_data = CrossSet(pixels, labels, indices[:trdata_nrd])
+    test_data = CrossSet(pixels, labels, indices[trdata_nrd:])
     # return
     return (training_data, test_data)
 
 
-def loadbogen(path):
+def getbogenfolders(resultfile="boxes/results.json", boxdir="boxes"):
+    """ Get the box folders of all processed boegen.
+
+    Parameters
+    ----------
+    resultfile : str, optional
+        results of 01_process_files.py or merge_shards.py, rejected boegen
+        are left out
+    boxdir : str, optional
+        folder of the boxes, searched if there is no result file
+
+    Returns
+    -------
+    folders : list of str
+        box folders, sorted by name
+
+    """
+    if os.path.exists(resultfile):
+        with open(resultfile) as f:
+            boegen = json.load(f)["boegen"]
+        return sorted(e["outputDir"] for e in boegen.values()
+                      if not e["rejected"])
+    return sorted(os.path.dirname(f)
+                  for f in glob.glob(os.path.join(boxdir, "*", "box0.png")))
+
+
+def loadbogen(path, scaled=True):
     """ Load a boegen that is to be evaluated.
 
     Parameters
     ----------
     path : str
         path to bogen
+    scaled : bool, optional
+        pixels as floats scaled to 0-1, otherwise uint8 pixels 0-255 (for
+        the reduced precision of evalhelper_nn.Network.setPrecision)
 
     Returns
     -------
@@ -82,7 +333,8 @@ def loadbogen(path):
 
     """
     # storage of data, 14 "rows" with 5x1600 arrays in each (answers x pixels)
-    storage = np.zeros(shape=(14, 5, 1600), dtype=float)
+    storage = np.zeros(shape=(14, 5, 1600),
+                       dtype=float if scaled else np.uint8)
 
     # current path
     current_bogen = path + "/box"
@@ -92,20 +344,23 @@ def loadbogen(path):
     j = 0
 
     # loop through all 70 boxes
-    for counter in range(70):
-        # current_box
-        current_box = current_bogen + str(counter) + ".png"
-        # convert greyscale and get value (0-255) for each pixel (scaled 0-1)
-        cur_px = np.array(
-            Image.open(current_box).convert('L').getdata()) / float(255)
-        # save in storage
-        storage[i][j] = cur_px
-        # increase iteration
-        if (j+1) % 5 == 0:
-            i = i + 1
-            j = 0
-        else:
-            j = j + 1
+    with ins.timer("loadbogen", path=path):
+        for counter in range(70):
+            # current_box
+            current_box = current_bogen + str(counter) + ".png"
+            # convert greyscale, get value (0-255) of each pixel (scaled 0-1)
+            cur_px = np.asarray(
+                Image.open(current_box).convert('L')).reshape(1600)
+            if scaled:
+                cur_px = cur_px / float(255)
+            # save in storage
+            storage[i][j] = cur_px
+            # increase iteration
+            if (j+1) % 5 == 0:
+                i = i + 1
+                j = 0
+            else:
+                j = j + 1
 
     # return data
     return storage
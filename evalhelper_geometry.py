@@ -0,0 +1,55 @@
+"""Evaluation helper - transformation and extraction of boxes."""
+import numpy as np
+from PIL import Image
+
+
+def transformPoints(transMatrix, points):
+    """Transform many points at once.
+
+    Parameters
+    ----------
+    transMatrix : ndarray
+        Matrix A (row by row) and vector b of the linear transformation
+    points : ndarray
+        2D points, shape (n, 2)
+
+    Returns
+    -------
+    ndarray
+        Transformed points A * point + b, shape (n, 2)
+
+    """
+    A = np.asarray(transMatrix[:4], dtype=float).reshape(2, 2)
+    b = np.asarray(transMatrix[4:], dtype=float)
+    return np.dot(np.asarray(points, dtype=float), A.T) + b
+
+
+def extractBoxes(page, corners, size=40):
+    """Crop and resize all boxes of a page.
+
+    Every box is cut out with `image.crop(corners[i]).resize((size, size))`
+    and the default bicubic filter of PIL, from one image of the page.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D uint8 array (rows = y, columns = x)
+    corners : ndarray
+        Corners [x0, y0, x1, y1] of every box, shape (n, 4)
+    size : int, optional
+        Size of the resized boxes
+
+    Returns
+    -------
+    boxes : ndarray
+        uint8 boxes, shape (n, size, size)
+
+    """
+    image = Image.fromarray(page)
+    # crop coordinates are rounded like PIL.Image.crop
+    corners = np.round(np.asarray(corners, dtype=float)).astype(int)
+    boxes = np.empty((len(corners), size, size), dtype=np.uint8)
+    for i, c in enumerate(corners.tolist()):
+        boxes[i] = np.asarray(image.crop(c).resize((size, size),
+                                                   Image.BICUBIC))
+    return boxes
@@ -0,0 +1,224 @@
+"""Evaluation helper - timers and counters of the processing stages."""
+import os
+import json
+import time
+import tempfile
+import cProfile
+
+# disabled by default, then every timer is the same no-op object
+# -> enabled timers and counters are aggregated in memory and appended as
+#    JSON lines, so worker processes can share one file (a temporary one
+#    if no logfile is given)
+
+# state of the current process
+_state = {"enabled": False, "logfile": None, "temporary": False,
+          "profile": None, "profiler": None}
+_stats = {}
+_counters = {}
+
+
+class _NullTimer(object):
+    """Timer that does nothing, used while disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULLTIMER = _NullTimer()
+
+
+class _Timer(object):
+    """Timer of a single call of a stage."""
+
+    def __init__(self, stage, fields):
+        self.stage = stage
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        addTime(self.stage, time.perf_counter() - self.start, **self.fields)
+        return False
+
+
+def enable(logfile=None, profile=None, append=False):
+    """Enable timers and counters in the current process.
+
+    Parameters
+    ----------
+    logfile : str, optional
+        JSON lines file, every event is appended, default is a temporary
+        file that finish() removes
+    profile : str, optional
+        Run cProfile until finish() and save the stats to this file
+    append : bool, optional
+        Keep existing events of the logfile, e.g. in worker processes
+
+    """
+    _state["temporary"] = False
+    if logfile is None:
+        # events of worker processes are collected in this file
+        handle, logfile = tempfile.mkstemp(prefix="timings_",
+                                           suffix=".jsonl")
+        os.close(handle)
+        _state["temporary"] = True
+    elif not append:
+        open(logfile, "w").close()
+    _state["enabled"] = True
+    _state["logfile"] = logfile
+    _state["profile"] = profile
+    if profile is not None:
+        _state["profiler"] = cProfile.Profile()
+        _state["profiler"].enable()
+
+
+def isEnabled():
+    """Check if instrumentation is enabled in the current process."""
+    return _state["enabled"]
+
+
+def getSettings():
+    """Settings to enable the same instrumentation in a worker process.
+
+    Returns
+    -------
+    settings : dict or None
+        Keyword arguments of enable without profiling, None if disabled
+
+    """
+    if not _state["enabled"]:
+        return None
+    return {"logfile": _state["logfile"], "append": True}
+
+
+def timer(stage, **fields):
+    """Time a stage with a with-statement.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage
+    **fields
+        Additional information written to the JSON lines, e.g. file
+
+    Returns
+    -------
+    timer : context manager
+
+    """
+    if not _state["enabled"]:
+        return _NULLTIMER
+    return _Timer(stage, fields)
+
+
+def addTime(stage, seconds, **fields):
+    """Add a measured time of a stage.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage
+    seconds : float
+        Runtime
+    **fields
+        Additional information written to the JSON lines
+
+    """
+    if not _state["enabled"]:
+        return
+    stats = _stats.setdefault(stage, [0, 0., 0.])
+    stats[0] += 1
+    stats[1] += seconds
+    stats[2] = max(stats[2], seconds)
+    fields.update({"stage": stage, "seconds": seconds})
+    _write(fields)
+
+
+def count(name, n=1):
+    """Increase a counter.
+
+    Parameters
+    ----------
+    name : str
+        Name of the counter
+    n : int, optional
+        Increment
+
+    """
+    if not _state["enabled"]:
+        return
+    _counters[name] = _counters.get(name, 0) + n
+    _write({"counter": name, "n": n})
+
+
+def _write(event):
+    """Append an event to the JSON lines file."""
+    if _state["logfile"] is None:
+        return
+    event["pid"] = os.getpid()
+    event["time"] = time.time()
+    with open(_state["logfile"], "a") as f:
+        f.write(json.dumps(event) + "\n")
+
+
+def summary(logfile=None):
+    """Aggregate timers and counters.
+
+    Parameters
+    ----------
+    logfile : str, optional
+        Aggregate the JSON lines of all processes instead of the timers of
+        the current process
+
+    Returns
+    -------
+    (stats, counters) : tuple of dict
+        stage -> [calls, total seconds, max seconds], counter -> value
+
+    """
+    if logfile is None or not os.path.exists(logfile):
+        return _stats, _counters
+
+    stats, counters = {}, {}
+    with open(logfile) as f:
+        for line in f:
+            event = json.loads(line)
+            if "counter" in event:
+                counters[event["counter"]] = (
+                    counters.get(event["counter"], 0) + event["n"])
+            else:
+                s = stats.setdefault(event["stage"], [0, 0., 0.])
+                s[0] += 1
+                s[1] += event["seconds"]
+                s[2] = max(s[2], event["seconds"])
+    return stats, counters
+
+
+def finish():
+    """Stop profiling and print the aggregated report, if enabled."""
+    if not _state["enabled"]:
+        return
+
+    if _state["profiler"] is not None:
+        _state["profiler"].disable()
+        _state["profiler"].dump_stats(_state["profile"])
+        print("Saved profile to", _state["profile"])
+
+    stats, counters = summary(_state["logfile"])
+    if _state["temporary"]:
+        os.remove(_state["logfile"])
+        _state["logfile"] = None
+    print("\n###\nTimings\n###")
+    print("%-20s %8s %12s %12s %12s" %
+          ("Stage", "Calls", "Total (s)", "Mean (ms)", "Max (ms)"))
+    for stage, (calls, total, longest) in sorted(
+            stats.items(), key=lambda item: -item[1][1]):
+        print("%-20s %8d %12.3f %12.3f %12.3f" %
+              (stage, calls, total, total / calls * 1000, longest * 1000))
+    for name, value in sorted(counters.items()):
+        print("%-20s %8d" % (name, value))
@@ -0,0 +1,382 @@
+"""Evaluation helper - template matching of the corner masks."""
+import os
+import csv
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+
+# template banks of the current process, see getTemplateBank
+_banks = {}
+
+
+def getWindow(page, x1, x2, y1, y2, width, height):
+    """Cut the part of the page that is covered by a search window.
+
+    Areas outside of the page are filled with zeros, exactly like
+    `PIL.Image.crop` does.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D array (rows = y, columns = x)
+    x1, x2, y1, y2 : int
+        Search window, i.e. range of upper left corners of the candidates
+    width, height : int
+        Size of the compared area
+
+    Returns
+    -------
+    window : ndarray
+        Part of the page of shape (y2-y1+height-1, x2-x1+width-1)
+
+    """
+    rows = y2 - y1 + height - 1
+    cols = x2 - x1 + width - 1
+    window = np.zeros(shape=(rows, cols), dtype=np.int64)
+
+    # intersection of the window and the page
+    top, left = max(y1, 0), max(x1, 0)
+    bottom = min(y1 + rows, page.shape[0])
+    right = min(x1 + cols, page.shape[1])
+    if bottom > top and right > left:
+        window[top-y1:bottom-y1, left-x1:right-x1] = \
+            page[top:bottom, left:right]
+    return window
+
+
+def getSquaredErrors(page, mask, x1, x2, y1, y2, masksq=None):
+    """Sum of squared errors between mask and all candidates of a window.
+
+    The sum is split into sum(window^2) - 2*sum(window*mask) + sum(mask^2).
+    The first term is taken from an integral image, the second one from a
+    single einsum over a sliding window view. All terms are integers, so
+    the result is exact.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D array (rows = y, columns = x)
+    mask : ndarray
+        Mask as 2D array
+    x1, x2, y1, y2 : int
+        Search window, i.e. range of upper left corners of the candidates
+    masksq : int, optional
+        Precomputed sum of the squared mask, see Template
+
+    Returns
+    -------
+    sse : ndarray
+        Sum of squared errors of shape (x2-x1, y2-y1), indexed [x, y]
+
+    """
+    height, width = mask.shape
+    window = getWindow(page, x1, x2, y1, y2, width, height)
+    mask = mask.astype(np.int64)
+
+    # sum of squared pixels of each candidate via integral image
+    integral = np.zeros(shape=(window.shape[0]+1, window.shape[1]+1),
+                        dtype=np.int64)
+    integral[1:, 1:] = np.cumsum(np.cumsum(window**2, axis=0), axis=1)
+    sq = (integral[height:, width:] - integral[:-height, width:] -
+          integral[height:, :-width] + integral[:-height, :-width])
+
+    # cross term of all candidates in one batched pass
+    views = sliding_window_view(window, (height, width))
+    cross = np.einsum("ijkl,kl->ij", views, mask)
+
+    if masksq is None:
+        masksq = np.sum(mask**2)
+    sse = sq - 2*cross + masksq
+    return sse.T
+
+
+def matchTemplate(page, mask, x1, x2, y1, y2, masksq=None):
+    """Find the position of a mask in a specific window.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D array (rows = y, columns = x)
+    mask : ndarray
+        Mask as 2D array
+    x1, x2, y1, y2 : int
+        Search window, i.e. range of upper left corners of the candidates
+    masksq : int, optional
+        Precomputed sum of the squared mask, see Template
+
+    Returns
+    -------
+    pos : list of int
+        Position [x,y] with the minimum mean squared error
+    mse : float
+        Mean squared error at this position
+
+    """
+    sse = getSquaredErrors(page, mask, x1, x2, y1, y2, masksq)
+
+    # first minimum in x-major order, same as the original double loop
+    x, y = np.unravel_index(np.argmin(sse), sse.shape)
+    return [x1 + int(x), y1 + int(y)], sse[x, y] / float(mask.size)
+
+
+def downsample(image, factor):
+    """Downsample an image by averaging blocks of factor x factor pixels.
+
+    Parameters
+    ----------
+    image : ndarray
+        2D array
+    factor : int
+        Downsampling factor
+
+    Returns
+    -------
+    small : ndarray
+        Downsampled 2D int64 array, rounded block means
+
+    """
+    rows = image.shape[0] // factor
+    cols = image.shape[1] // factor
+    blocks = image[:rows*factor, :cols*factor].astype(np.int64).reshape(
+        rows, factor, cols, factor)
+    return np.rint(blocks.mean(axis=(1, 3))).astype(np.int64)
+
+
+def matchTemplatePyramid(page, mask, x1, x2, y1, y2, factor=4, radius=None):
+    """Find the position of a mask coarse-to-fine.
+
+    The mask is first searched on a page downsampled by `factor`, then the
+    position is refined at full resolution in a small neighbourhood. The
+    cost is about 1/factor^4 of the exhaustive search, so much larger
+    search windows (or the whole page) become affordable.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D array (rows = y, columns = x)
+    mask : ndarray
+        Mask as 2D array
+    x1, x2, y1, y2 : int
+        Search window, i.e. range of upper left corners of the candidates
+    factor : int, optional
+        Downsampling factor of the coarse level
+    radius : int, optional
+        Half size of the refinement neighbourhood, default 2*factor
+
+    Returns
+    -------
+    pos : list of int
+        Position [x,y] with the minimum mean squared error
+    mse : float
+        Mean squared error at this position
+
+    """
+    if radius is None:
+        radius = 2 * factor
+
+    # coarse level, candidates covering the whole search window
+    small_mask = downsample(mask, factor)
+    cx1, cy1 = x1 // factor, y1 // factor
+    cx2, cy2 = -(-x2 // factor), -(-y2 // factor)
+    # only the part of the page below the search window is downsampled
+    region = getWindow(page, cx1*factor, cx1*factor+1, cy1*factor,
+                       cy1*factor+1,
+                       (cx2 - cx1 + small_mask.shape[1] - 1) * factor,
+                       (cy2 - cy1 + small_mask.shape[0] - 1) * factor)
+    (cx, cy), _ = matchTemplate(downsample(region, factor), small_mask,
+                                0, cx2 - cx1, 0, cy2 - cy1)
+    cx, cy = cx + cx1, cy + cy1
+
+    # fine level, small neighbourhood inside the search window
+    fx1 = min(max(cx*factor - radius, x1), x2 - 1)
+    fy1 = min(max(cy*factor - radius, y1), y2 - 1)
+    fx2 = max(min(cx*factor + radius + 1, x2), fx1 + 1)
+    fy2 = max(min(cy*factor + radius + 1, y2), fy1 + 1)
+    return matchTemplate(page, mask, fx1, fx2, fy1, fy2)
+
+
+def getConfidence(page, mask, pos, centered=None, norm=None):
+    """Match confidence of a mask at a position.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D array (rows = y, columns = x)
+    mask : ndarray
+        Mask as 2D array
+    pos : list of int
+        Position [x,y] of the mask
+    centered, norm : ndarray and float, optional
+        Precomputed mask minus its mean and its norm, see Template
+
+    Returns
+    -------
+    ncc : float
+        Normalized cross-correlation between -1 and 1, 1 is a perfect match
+
+    """
+    height, width = mask.shape
+    patch = getWindow(page, pos[0], pos[0]+1, pos[1], pos[1]+1,
+                      width, height).astype(float)
+    patch = patch - patch.mean()
+    if centered is None:
+        centered = mask - mask.mean()
+        norm = np.sqrt(np.sum(centered**2))
+    denom = np.sqrt(np.sum(patch**2)) * norm
+    if denom == 0:
+        return 0.
+    return float(np.sum(patch * centered) / denom)
+
+
+def matchTemplatePrior(page, template, x1, x2, y1, y2, radius,
+                       minConfidence):
+    """Find the position of a mask in a tight window around its prior.
+
+    Parameters
+    ----------
+    page : ndarray
+        Page as 2D array (rows = y, columns = x)
+    template : Template
+        Mask with a running estimate of its position
+    x1, x2, y1, y2 : int
+        Full search window, the tight window is clipped to it
+    radius : int
+        Half size of the tight window
+    minConfidence : float
+        Minimum match confidence inside the tight window
+
+    Returns
+    -------
+    pos : list of int
+        Position [x,y], None if the full window needs to be searched
+    confidence : float
+        Match confidence, None if the full window needs to be searched
+
+    """
+    px, py = np.rint(template.prior).astype(int)
+    tx1, tx2 = max(px - radius, x1), min(px + radius + 1, x2)
+    ty1, ty2 = max(py - radius, y1), min(py + radius + 1, y2)
+    if tx1 >= tx2 or ty1 >= ty2:
+        return None, None
+    pos, mse = matchTemplate(page, template.array, tx1, tx2, ty1, ty2,
+                             template.sumsq)
+
+    # a minimum at the border of the tight window may continue outside
+    if ((pos[0] in (tx1, tx2 - 1) and pos[0] not in (x1, x2 - 1)) or
+            (pos[1] in (ty1, ty2 - 1) and pos[1] not in (y1, y2 - 1))):
+        return None, None
+    confidence = getConfidence(page, template.array, pos, template.centered,
+                               template.norm)
+    if confidence < minConfidence:
+        return None, None
+    return pos, confidence
+
+
+class Template(object):
+    """Corner mask with its search window and precomputed statistics."""
+
+    def __init__(self, name, image, x1, x2, y1, y2, xoff, yoff, size=36):
+        """Initialize template.
+
+        Parameters
+        ----------
+        name : str
+            Name of the mask, e.g. "ul"
+        image : image
+            Mask as loaded from disk
+        x1, x2, y1, y2 : int
+            Search window, i.e. range of upper left corners
+        xoff, yoff : int
+            Size of the cropped candidates of the "bruteforce" search
+        size : int, optional
+            Only the upper left size x size pixels are compared
+
+        """
+        self.name = name
+        self.x1, self.x2, self.y1, self.y2 = x1, x2, y1, y2
+        self.xoff, self.yoff = xoff, yoff
+
+        # greyscale array and statistics, computed once
+        self.array = np.asarray(image.convert("L"))[:size, :size]
+        self.mean = self.array.mean()
+        self.centered = self.array - self.mean
+        self.norm = np.sqrt(np.sum(self.centered**2))
+        self.sumsq = int(np.sum(self.array.astype(np.int64)**2))
+
+        # running estimate [x,y] of the position, see updatePrior
+        self.prior = None
+
+    def updatePrior(self, pos, weight=0.5):
+        """Update the running estimate of the position.
+
+        Parameters
+        ----------
+        pos : list of int
+            Position [x,y] found on the current bogen
+        weight : float, optional
+            Weight of the current position, the older ones decay
+
+        """
+        if self.prior is None:
+            self.prior = np.array(pos, dtype=float)
+        else:
+            self.prior = (1. - weight) * self.prior + weight * np.array(pos)
+
+
+class TemplateBank(object):
+    """All corner masks of a form type, loaded once per process."""
+
+    def __init__(self, config="mask_positions.csv", maskdir="masks"):
+        """Load the masks and their search windows.
+
+        Parameters
+        ----------
+        config : str, optional
+            Tab separated file with one row per mask: name, image file,
+            search window x1, x2, y1, y2, offsets xoff, yoff and size
+        maskdir : str, optional
+            Folder of the mask images
+
+        """
+        self.templates = []
+        images = {}
+        with open(config) as posfile:
+            reader = csv.DictReader(posfile, delimiter="\t",
+                                    skipinitialspace=True)
+            for row in reader:
+                # masks used more than once are only loaded once
+                if row["file"] not in images:
+                    image = Image.open(os.path.join(maskdir, row["file"]))
+                    image.load()
+                    images[row["file"]] = image
+                self.templates.append(Template(
+                    row["mask"], images[row["file"]],
+                    *[int(row[c]) for c in ["x1", "x2", "y1", "y2", "xoff",
+                                            "yoff", "size"]]))
+
+    def __iter__(self):
+        return iter(self.templates)
+
+    def __len__(self):
+        return len(self.templates)
+
+
+def getTemplateBank(config="mask_positions.csv", maskdir="masks"):
+    """Get the template bank, loaded only once per process.
+
+    Parameters
+    ----------
+    config : str, optional
+        Tab separated file of the masks, see TemplateBank
+    maskdir : str, optional
+        Folder of the mask images
+
+    Returns
+    -------
+    bank : TemplateBank
+
+    """
+    key = (os.path.abspath(config), os.path.abspath(maskdir))
+    if key not in _banks:
+        _banks[key] = TemplateBank(config, maskdir)
+    return _banks[key]
@@ -1,20 +1,38 @@
 """Evaluation helper - Neural Network."""
 
+import os
+import json
 import random
+import struct
 import numpy as np
 import math
 
+# Own scripts
+import evalhelper_instrumentation as ins
+import evalhelper_statistics as st
+
+# default file of the trained weights, see saveNetwork
+WEIGHTS = "nn_weights.bin"
+
+# file format: magic, format version, length of the JSON header, header,
+# then the raw arrays, each one aligned for memory mapping
+MAGIC = b"EVALNN"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
 
 class Network(object):
     """Neural network class."""
 
-    def __init__(self, sizes):
+    def __init__(self, sizes, weights=None, biases=None):
         """Constructor.
 
         Parameters
         ----------
         sizes : list
             layers and neutrons
+        weights, biases : lists of ndarrays, optional
+            trained weights and bias, e.g. from loadNetwork
 
         Returns
         -------
@@ -25,27 +43,101 @@ class Network(object):
         # layers
         self.num_layers = len(sizes)
         self.sizes = sizes
-        # random initials with fixed seed
-        random.seed(1)
-        self.biases = [np.random.randn(x, 1) for x in sizes[1:]]
-        self.weights = [(np.random.randn(x, y)/math.sqrt(self.sizes[0]))
-                        for x, y in zip(self.sizes[1:], self.sizes[:-1])]
+        if weights is not None:
+            self.weights = weights
+            self.biases = biases
+        else:
+            # random initials with fixed seed
+            random.seed(1)
+            self.biases = [np.random.randn(x, 1) for x in sizes[1:]]
+            self.weights = [(np.random.randn(x, y)/math.sqrt(self.sizes[0]))
+                            for x, y in zip(self.sizes[1:], self.sizes[:-1])]
         # batch, iterations and learning rate
         self.mini_batchsize = 50
         self.epochs = 3
         self.eta = 0.1
+        # precision of feedforward_batch, see setPrecision
+        self.precision = "float64"
+        self.lowweights = None
 
-    def SGD(self, training_data, test_data=None):
+    def SGD(self, training_data, test_data=None, checkpoint=None,
+            resume=False, patience=None, minDelta=0., schedule=None,
+            sample=None):
         """Stochastic gradient descent.
 
         Parameters
         ----------
-        training data : list of tuples
-            data to train the NN
+        training data : list of tuples, dataloader.CrossSet or iterable
+            data to train the NN, or a re-iterable stream of (x,y) mini
+            batches with one column per pair (e.g. dataloader.BatchStream),
+            iterated once per epoch, so a plain iterator or generator
+            raises TypeError
 
-        test data : list of tuples
+        test data : list of tuples or dataloader.CrossSet
             optional test data to evaluate NN after each epoch
 
+        checkpoint : str, optional
+            file to save weights and training state after every epoch
+
+        resume : bool, optional
+            continue the training of the checkpoint, if it exists
+
+        patience : int, optional
+            stop if the test accuracy did not improve by more than minDelta
+            for patience epochs
+
+        minDelta : float, optional
+            minimum improvement of the test accuracy (0-1)
+
+        schedule : callable, optional
+            learning rate of an epoch (starting at 0), e.g.
+            exponentialSchedule, default is the constant self.eta
+
+        sample : float, optional
+            fraction of test data evaluated after each epoch (0-1), the
+            same random sample every epoch, all test data is evaluated
+            after the last epoch
+
+        Returns
+        -------
+        history : list of float
+            test accuracy after every epoch
+
+        """
+        # an iterator would be exhausted after the first epoch
+        if (not hasattr(training_data, "__getitem__") and
+                iter(training_data) is training_data):
+            raise TypeError("training_data must be re-iterable, e.g. "
+                            "dataloader.BatchStream, not an iterator")
+
+        def trainEpoch(j, eta):
+            if hasattr(training_data, "__getitem__"):
+                # every epoch shuffles the original order -> the same mini
+                # batches after resuming from a checkpoint
+                if hasattr(training_data, "shuffle"):
+                    data = training_data[np.arange(len(training_data))]
+                else:
+                    data = list(training_data)
+                self.update_epoch(data, eta)
+            else:
+                # stream of (x,y) mini batches, see dataloader.BatchStream
+                for x_batch, y_batch in training_data:
+                    self.update_batch(x_batch, y_batch, eta)
+
+        return trainEpochs(self, trainEpoch, test_data, checkpoint, resume,
+                           patience, minDelta, schedule, sample)
+
+    def update_epoch(self, training_data, eta=None):
+        """Update weights for one epoch of a list of training data.
+
+        Parameters
+        ----------
+        training data : list of tuples or dataloader.CrossSet
+            data to train the NN, shuffled in place
+
+        eta : float, optional
+            learning rate, default is self.eta
+
         Returns
         -------
         None : none
@@ -53,38 +145,29 @@ class Network(object):
         """
         # length of training data
         n = len(training_data)
-
-        # length of optional test data
-        if test_data:
-            n_test = len(test_data)
-
-        # loop throug epochs
-        for j in range(self.epochs):
-            # randomly sort training data for mini batches
+        # randomly sort training data for mini batches
+        if hasattr(training_data, "shuffle"):
+            training_data.shuffle()
+        else:
             random.shuffle(training_data)
-            # one mini batch only -> seems to be described in exercise (c)
-            # self.update_mini_batch(training_data[0:self.mini_batchsize],
-            #     self.eta)
-            # create mini batches -> use entire training_data set
-            mini_batches = [training_data[k:k+self.mini_batchsize]
-                            for k in range(0, n, self.mini_batchsize)]
-            # loop through mini batches and update weights
-            for mini_batch in mini_batches:
-                self.update_mini_batch(mini_batch, self.eta)
-            # print progress if test data is provided
-            if test_data:
-                evalu = self.evaluate(test_data)
-                print("Epoch:", (j+1), evalu, "from", n_test, "->",
-                      round(evalu/n_test*100, 2), "%")
-            else:
-                print("Epoch complete: ", j)
+        # one mini batch only -> seems to be described in exercise (c)
+        # self.update_mini_batch(training_data[0:self.mini_batchsize],
+        #     self.eta)
+        # create mini batches -> use entire training_data set
+        mini_batches = [training_data[k:k+self.mini_batchsize]
+                        for k in range(0, n, self.mini_batchsize)]
+        # loop through mini batches and update weights
+        if eta is None:
+            eta = self.eta
+        for mini_batch in mini_batches:
+            self.update_mini_batch(mini_batch, eta)
 
     def update_mini_batch(self, mini_batch, eta):
         """Upddate weights for a single mini batch.
 
         Parameters
         ----------
-        mini_batch : list of tuples
+        mini_batch : list of tuples or dataloader.CrossSet
             tuples that are to be "evaluated" for the SDG update
 
         eta : float
@@ -96,21 +179,42 @@ class Network(object):
             update of weights and bias of NN object
 
         """
-        # storage for nablas
-        nabla_b = [np.zeros(b.shape) for b in self.biases]
-        nabla_w = [np.zeros(w.shape) for w in self.weights]
-        for x, y in mini_batch:
-            # derivative for single training pair
-            # -> use general backprob for gradient (!)
-            delta_nabla_b, delta_nabla_w = self.backprop(x, y)
-            # elemtwise addition (!)
-            nabla_b = [nb+dnb for nb, dnb in zip(nabla_b, delta_nabla_b)]
-            nabla_w = [nw+dnw for nw, dnw in zip(nabla_w, delta_nabla_w)]
-        # update weights
-        self.weights = [w-(float(eta)/len(mini_batch))*nw
-                        for w, nw in zip(self.weights, nabla_w)]
-        self.biases = [b-(float(eta)/len(mini_batch))*nb
-                       for b, nb in zip(self.biases, nabla_b)]
+        # stack the mini batch -> one column per training pair
+        if hasattr(mini_batch, "matrices"):
+            x_batch, y_batch = mini_batch.matrices()
+        else:
+            x_batch = np.hstack([x for x, y in mini_batch])
+            y_batch = np.hstack([y for x, y in mini_batch])
+        self.update_batch(x_batch, y_batch, eta)
+
+    def update_batch(self, x_batch, y_batch, eta):
+        """Update weights for a single mini batch in matrix form.
+
+        Parameters
+        ----------
+        x_batch : ndarray
+            boxes, one column per training pair, shape (1600, m)
+
+        y_batch : ndarray
+            results, one column per training pair, shape (2, m)
+
+        eta : float
+            learning rate
+
+        Returns
+        -------
+        None : none
+            update of weights and bias of NN object
+
+        """
+        # derivative summed over all training pairs in one pass
+        nabla_b, nabla_w = self.backprop_batch(x_batch, y_batch)
+        # update weights in place
+        m = x_batch.shape[1]
+        for w, nw in zip(self.weights, nabla_w):
+            w -= (float(eta)/m)*nw
+        for b, nb in zip(self.biases, nabla_b):
+            b -= (float(eta)/m)*nb
 
     def backprop(self, x, y):
         """Partial derivative of cost function for single pair x,y.
@@ -161,6 +265,51 @@ class Network(object):
         # return gradients
         return (nabla_b, nabla_w)
 
+    def backprop_batch(self, x, y):
+        """Partial derivative of cost function summed over many pairs x,y.
+
+        Matrix form of backprop, the pairs are the columns of x and y.
+
+        Parameters
+        ----------
+        x : ndarray
+            boxes, shape (1600, m)
+
+        y : ndarray
+            results (crossed vs uncrossed), shape (2, m)
+
+        Returns
+        -------
+        (nabla_b, nabla_w) : tuple of lists
+            gradient summed over all m pairs
+
+        """
+        # storage
+        nabla_b = [None] * len(self.biases)
+        nabla_w = [None] * len(self.weights)
+        # feedforward, one column per pair
+        activation = x
+        activations = [x]
+        zs = []
+        for b, w in zip(self.biases, self.weights):
+            z = np.dot(w, activation) + b
+            zs.append(z)
+            activation = sigmoid(z)
+            activations.append(activation)
+        # backward pass, BP1
+        delta = self.delta_ce(activations[-1], y)
+        # BP3 and BP4 summed over all columns
+        nabla_b[-1] = delta.sum(axis=1, keepdims=True)
+        nabla_w[-1] = np.dot(delta, activations[-2].transpose())
+        for l in range(2, self.num_layers):
+            sp = sigmoid_prime(zs[-l])
+            # BP2, elementwise for every column
+            delta = np.dot(self.weights[-l+1].transpose(), delta) * sp
+            nabla_b[-l] = delta.sum(axis=1, keepdims=True)
+            nabla_w[-l] = np.dot(delta, activations[-l-1].transpose())
+        # return gradients
+        return (nabla_b, nabla_w)
+
     def delta_ce(self, a, y):
         """Delta for cross-entropy cost function.
 
@@ -200,25 +349,228 @@ class Network(object):
         # return prediction
         return a
 
+    def setPrecision(self, precision="float64"):
+        """Select the precision of feedforward_batch and predict_batch.
+
+        The weights are converted once, call it again after training.
+        "int8" emulates quantization: the weights are rounded to int8 with
+        one scale per output neuron, but multiplied in float32, as numpy
+        has no fast integer matrix multiplication. It shows the accuracy
+        of int8 weights at the speed of "float32".
+
+        Parameters
+        ----------
+        precision : str, optional
+            "float64" uses the trained weights, "float32" float32 weights,
+            "int8" int8 weights with one scale per output neuron
+
+        Returns
+        -------
+        None : none
+
+        """
+        if precision not in ["float64", "float32", "int8"]:
+            raise ValueError("Unknown precision: " + precision)
+        self.precision = precision
+        self.lowweights = None
+        if precision == "float64":
+            return
+        self.lowweights = []
+        for b, w in zip(self.biases, self.weights):
+            if precision == "int8":
+                # symmetric quantization, -127 to 127 per row
+                scale = np.abs(w).max(axis=1) / 127.
+                scale[scale == 0] = 1.
+                w = np.rint(w / scale[:, None])
+            else:
+                scale = np.ones(len(w))
+            # transposed once -> one row of inputs per box
+            self.lowweights.append((np.ascontiguousarray(w.T, np.float32),
+                                    scale.astype(np.float32),
+                                    b.T.astype(np.float32)))
+
+    def feedforward_batch(self, X):
+        """Feedforward of NN for many inputs at once.
+
+        Parameters
+        ----------
+        X : ndarray
+            input boxes, one per row, shape (N, 1600), either scaled to
+            0-1 or as uint8 pixels 0-255
+
+        Returns
+        -------
+        A : ndarray
+            predicted NN results, one per row, shape (N, 2)
+
+        """
+        if self.precision != "float64":
+            return self.feedforward_lowprecision(X)
+
+        # pixels 0-255 -> scaled as in training
+        if X.dtype == np.uint8:
+            X = X / float(255)
+        # one matrix multiplication per layer for all rows
+        for b, w in zip(self.biases, self.weights):
+            X = sigmoid(np.dot(X, w.T) + b.T)
+        return X
+
+    def feedforward_lowprecision(self, X):
+        """Feedforward of NN in float32 or with int8 weights.
+
+        Parameters
+        ----------
+        X : ndarray
+            input boxes, one per row, shape (N, 1600), either scaled to
+            0-1 or as uint8 pixels 0-255
+
+        Returns
+        -------
+        A : ndarray
+            predicted NN results as float32, one per row, shape (N, 2)
+
+        """
+        # the scaling of uint8 pixels is applied to the first layer output
+        pixelscale = np.float32(1. / 255 if X.dtype == np.uint8 else 1.)
+        scales = [scale * pixelscale if i == 0 else scale
+                  for i, (w, scale, b) in enumerate(self.lowweights)]
+
+        # small chunks of rows, their float32 copy stays in the cache
+        result = np.empty((len(X), self.sizes[-1]), dtype=np.float32)
+        with np.errstate(over="ignore"):
+            for k in range(0, len(X), 256):
+                A = X[k:k+256].astype(np.float32)
+                for (w, _, b), scale in zip(self.lowweights, scales):
+                    A = sigmoid(np.dot(A, w) * scale + b)
+                result[k:k+256] = A
+        return result
+
+    def comparePrecision(self, test_data, precision):
+        """Compare a reduced precision with float64 on test data.
+
+        Parameters
+        ----------
+        test_data : list of tuples or dataloader.CrossSet
+            data to be tested with the NN
+        precision : str
+            "float32" or "int8", see setPrecision
+
+        Returns
+        -------
+        result : dict
+            accuracy of both precisions and the number of boxes whose
+            classification changed
+
+        """
+        # uint8 pixels of a CrossSet, as 03_eval_nn.py uses them
+        x, y = testMatrices(test_data)
+        x = x.T
+        desired = np.argmax(y, axis=0)
+
+        current = self.precision
+        self.setPrecision("float64")
+        reference = self.predict_batch(x)
+        self.setPrecision(precision)
+        low = self.predict_batch(x)
+        self.setPrecision(current)
+        return {"precision": precision,
+                "accuracy_float64": float(np.mean(reference == desired)),
+                "accuracy": float(np.mean(low == desired)),
+                "changed": int(np.sum(low != reference))}
+
+    def predict_batch(self, X):
+        """Check for many boxes at once if they are crossed.
+
+        Parameters
+        ----------
+        X : ndarray
+            input boxes, one per row, shape (N, 1600)
+
+        Returns
+        -------
+        result : ndarray
+            index of the maximum output for each box, shape (N,)
+
+        """
+        with ins.timer("predict_batch"):
+            result = np.argmax(self.feedforward_batch(X), axis=1)
+        ins.count("predicted_boxes", len(X))
+        return result
+
     def evaluate(self, test_data):
         """Evaluate the accuracy of the NN given test_data.
 
         Parameters
         ----------
-        test_data : list of tuples
+        test_data : list of tuples or dataloader.CrossSet
             data to be tested with the NN
 
         Returns
         -------
-        result : float
+        result : int
             accuracy of NN, number of correct classifications
 
         """
-        # evaluate each x of test data
-        test_results = [(np.argmax(self.feedforward(x)), np.argmax(y))
-                        for (x, y) in test_data]
-        # return sum of correct classifications
-        return sum(int(x == y) for (x, y) in test_results)
+        return self.evaluateMetrics(test_data)["correct"]
+
+    def evaluateMetrics(self, test_data, sample=None, seed=0, bins=10,
+                        chunksize=10000):
+        """Evaluate the NN on test_data with batched feedforwards.
+
+        Parameters
+        ----------
+        test_data : list of tuples or dataloader.CrossSet
+            data to be tested with the NN
+        sample : float, optional
+            fraction of test_data to be evaluated (0-1), default all
+        seed : int, optional
+            seed of the random sample
+        bins : int, optional
+            number of bins of the score histogram
+        chunksize : int, optional
+            number of boxes per feedforward
+
+        Returns
+        -------
+        metrics : dict
+            n and correct boxes, accuracy, confusion matrix (rows desired,
+            columns predicted class), precision and recall per class,
+            histogram of the output of the last class (crossed) from 0 to 1
+
+        """
+        n = len(test_data)
+        rows = np.arange(n)
+        if sample is not None and sample < 1:
+            # sorted -> sequential reads from the memory-mapped cache
+            rows = np.sort(np.random.RandomState(seed).choice(
+                n, max(int(n * sample), 1), replace=False))
+
+        nclass = self.sizes[-1]
+        confusion = np.zeros((nclass, nclass), dtype=int)
+        edges = np.linspace(0., 1., bins + 1)
+        histogram = np.zeros(bins, dtype=int)
+        for k in range(0, len(rows), chunksize):
+            x, y = testMatrices(test_data, rows[k:k+chunksize])
+            A = self.feedforward_batch(x.T)
+            desired = np.argmax(y, axis=0)
+            predicted = np.argmax(A, axis=1)
+            confusion += np.bincount(desired * nclass + predicted,
+                                     minlength=nclass**2).reshape(
+                                         nclass, nclass)
+            histogram += np.histogram(A[:, -1], edges)[0]
+
+        correct = int(np.trace(confusion))
+        hits = np.diag(confusion).astype(float)
+        return {"n": len(rows),
+                "correct": correct,
+                "accuracy": correct / float(max(len(rows), 1)),
+                "confusion": confusion.tolist(),
+                "precision": (hits / np.maximum(confusion.sum(axis=0), 1)
+                              ).tolist(),
+                "recall": (hits / np.maximum(confusion.sum(axis=1), 1)
+                           ).tolist(),
+                "histogram": histogram.tolist(),
+                "edges": edges.tolist()}
 
     def crossed(self, inputdata):
         """Check if single box is crossed.
@@ -237,6 +589,285 @@ class Network(object):
         return (np.argmax(self.feedforward(inputdata)))
 
 
+# Training
+def trainEpochs(network, trainEpoch, test_data=None, checkpoint=None,
+                resume=False, patience=None, minDelta=0., schedule=None,
+                sample=None):
+    """Epoch loop of Network.SGD and evalhelper_parallel.SGD.
+
+    Evaluates, checkpoints and stops early after every epoch, see
+    Network.SGD for the parameters.
+
+    Parameters
+    ----------
+    network : Network
+        network to be trained, its weights are updated in place
+    trainEpoch : callable
+        trains one epoch, called with the epoch (starting at 0) and the
+        learning rate
+
+    Returns
+    -------
+    history : list of float
+        test accuracy after every epoch
+
+    """
+    # state of the training, possibly from a checkpoint
+    start, history, best, stale = 0, [], None, 0
+    metrics = None
+    if resume and checkpoint is not None and os.path.exists(checkpoint):
+        loaded, state = loadCheckpoint(checkpoint)
+        for a, saved in zip(network.weights + network.biases,
+                            loaded.weights + loaded.biases):
+            a[...] = saved
+        start, history = state["epoch"], state["history"]
+        best, stale = state["best"], state["stale"]
+        version, internal, gauss = state["random"]
+        random.setstate((version, tuple(internal), gauss))
+        print("Resumed from", checkpoint, "after epoch", start)
+        # the training of the checkpoint already stopped early
+        if patience is not None and test_data and stale >= patience:
+            print("Stopped after epoch", start, "-> no improvement for",
+                  stale, "epochs")
+            start = network.epochs
+
+    # loop throug epochs
+    for j in range(start, network.epochs):
+        eta = schedule(j) if schedule is not None else network.eta
+        with ins.timer("epoch", epoch=j+1):
+            trainEpoch(j, eta)
+        # print progress if test data is provided
+        if test_data:
+            # same sample in every epoch (fixed seed) -> comparable
+            # accuracies for the early stopping
+            with ins.timer("evaluate", epoch=j+1):
+                metrics = network.evaluateMetrics(test_data, sample)
+            print("Epoch:", (j+1), metrics["correct"], "from",
+                  metrics["n"], "->", round(metrics["accuracy"]*100, 2), "%")
+            history.append(metrics["accuracy"])
+            if best is None or history[-1] > best + minDelta:
+                best, stale = history[-1], 0
+            else:
+                stale += 1
+        else:
+            print("Epoch complete: ", j)
+
+        if checkpoint is not None:
+            saveCheckpoint(network, checkpoint, j + 1, history, best, stale)
+        # stop on a plateau of the test accuracy
+        if patience is not None and test_data and stale >= patience:
+            print("Stopped after epoch", j + 1, "-> no improvement for",
+                  stale, "epochs")
+            break
+
+    # full pass over the test data
+    if test_data:
+        if metrics is None or metrics["n"] < len(test_data):
+            with ins.timer("evaluate"):
+                metrics = network.evaluateMetrics(test_data)
+        st.printMetrics(metrics)
+    return history
+
+
+# Test data
+def testMatrices(test_data, rows=None):
+    """Get test data as matrices, one column per box.
+
+    Parameters
+    ----------
+    test_data : list of tuples or dataloader.CrossSet
+        data to be tested with the NN
+    rows : ndarray, optional
+        positions in test_data to be returned, default all
+
+    Returns
+    -------
+    (x, y) : tuple of ndarray
+        x = 1600xm pixels, uint8 for a CrossSet, y = 2xm desired output
+
+    """
+    if hasattr(test_data, "matrices"):
+        indices = test_data.indices if rows is None else \
+            test_data.indices[rows]
+        return test_data.matrices(indices, scaled=False)
+    if rows is not None:
+        test_data = [test_data[i] for i in rows]
+    return (np.hstack([x for x, y in test_data]),
+            np.hstack([y for x, y in test_data]))
+
+
+# Saving and loading
+def saveNetwork(network, path=WEIGHTS, state=None):
+    """Save the weights of a network in a versioned binary format.
+
+    Parameters
+    ----------
+    network : Network
+        network to be saved
+    path : str, optional
+        file of the weights
+    state : dict, optional
+        JSON serializable training state, see saveCheckpoint
+
+    Returns
+    -------
+    None : none
+
+    """
+    arrays = []
+    for i, (w, b) in enumerate(zip(network.weights, network.biases)):
+        arrays += [("w%d" % i, np.ascontiguousarray(w)),
+                   ("b%d" % i, np.ascontiguousarray(b))]
+
+    # offsets relative to the start of the data, which is aligned as well
+    entries = []
+    offset = 0
+    for name, a in arrays:
+        entries.append({"name": name, "dtype": a.dtype.str,
+                        "shape": list(a.shape), "offset": offset})
+        offset += -(-a.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"sizes": list(network.sizes),
+                         "mini_batchsize": network.mini_batchsize,
+                         "epochs": network.epochs, "eta": network.eta,
+                         "arrays": entries, "state": state}).encode()
+    start = len(MAGIC) + 8 + len(header)
+    start = -(-start // ALIGNMENT) * ALIGNMENT
+
+    # replaced at once, an interrupted write keeps the old file
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(header)))
+        f.write(header)
+        for entry, (name, a) in zip(entries, arrays):
+            f.seek(start + entry["offset"])
+            f.write(a.tobytes())
+    os.replace(path + ".tmp", path)
+
+
+def readHeader(path):
+    """Read the header of a file saved by saveNetwork.
+
+    Parameters
+    ----------
+    path : str
+        file of the weights
+
+    Returns
+    -------
+    (header, start) : tuple
+        header as dict and offset of the arrays in the file
+
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        version, length = struct.unpack("<II", f.read(8))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Unknown format of the weights: " + path)
+        header = json.loads(f.read(length).decode())
+    return header, -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+
+
+def loadNetwork(path=WEIGHTS, mmap=True):
+    """Load a network saved by saveNetwork.
+
+    Parameters
+    ----------
+    path : str, optional
+        file of the weights
+    mmap : bool, optional
+        map the weights read-only into memory, shared by all processes
+        that load the same file (for inference), otherwise they are copied
+        (e.g. to continue training)
+
+    Returns
+    -------
+    network : Network
+        network with the saved weights
+
+    """
+    header, start = readHeader(path)
+    arrays = {}
+    for entry in header["arrays"]:
+        a = np.memmap(path, dtype=entry["dtype"], mode="r",
+                      offset=start + entry["offset"],
+                      shape=tuple(entry["shape"]))
+        arrays[entry["name"]] = a if mmap else np.array(a)
+
+    nlayers = len(header["sizes"]) - 1
+    network = Network(header["sizes"],
+                      [arrays["w%d" % i] for i in range(nlayers)],
+                      [arrays["b%d" % i] for i in range(nlayers)])
+    network.mini_batchsize = header["mini_batchsize"]
+    network.epochs = header["epochs"]
+    network.eta = header["eta"]
+    return network
+
+
+def saveCheckpoint(network, path, epoch, history, best, stale):
+    """Save weights and training state after an epoch.
+
+    Parameters
+    ----------
+    network : Network
+        network during training
+    path : str
+        file of the checkpoint
+    epoch : int
+        number of finished epochs
+    history : list of float
+        test accuracy after every epoch
+    best : float
+        best test accuracy so far
+    stale : int
+        epochs without improvement of the test accuracy
+
+    Returns
+    -------
+    None : none
+
+    """
+    version, internal, gauss = random.getstate()
+    saveNetwork(network, path, {"epoch": epoch, "history": history,
+                                "best": best, "stale": stale,
+                                "random": [version, list(internal), gauss]})
+
+
+def loadCheckpoint(path):
+    """Load a checkpoint saved by saveCheckpoint.
+
+    Parameters
+    ----------
+    path : str
+        file of the checkpoint
+
+    Returns
+    -------
+    (network, state) : tuple
+        network with writable weights and training state
+
+    """
+    state = readHeader(path)[0]["state"]
+    return loadNetwork(path, mmap=False), state
+
+
+def exponentialSchedule(eta, decay):
+    """Learning rate schedule eta * decay^epoch, see Network.SGD.
+
+    Parameters
+    ----------
+    eta : float
+        learning rate of the first epoch
+    decay : float
+        factor per epoch
+
+    Returns
+    -------
+    schedule : callable
+        learning rate of an epoch (starting at 0)
+
+    """
+    return lambda epoch: eta * decay**epoch
+
+
 # General functions
 def sigmoid(z):
     """Sigmoid activation function.
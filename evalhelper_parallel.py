@@ -0,0 +1,274 @@
+"""Evaluation helper - data-parallel training of the neural network."""
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# Own scripts
+import evalhelper_dataloader as dl
+import evalhelper_nn as nn
+
+# shared arrays and network of a worker process, set once by initWorker
+_worker = {}
+
+
+class SharedArrays(object):
+    """Arrays in shared memory, attached by name in other processes."""
+
+    def __init__(self, arrays=None, spec=None):
+        """Create shared copies of arrays or attach existing ones.
+
+        Parameters
+        ----------
+        arrays : dict, optional
+            name -> ndarray, copied into new shared memory blocks
+        spec : dict, optional
+            name -> (block, shape, dtype) of existing blocks, see spec()
+
+        """
+        self.blocks = {}
+        self.arrays = {}
+        self.owner = arrays is not None
+        if arrays is not None:
+            spec = {}
+            for name, a in arrays.items():
+                block = shared_memory.SharedMemory(create=True,
+                                                   size=max(a.nbytes, 1))
+                spec[name] = (block.name, a.shape, a.dtype.str)
+                self.blocks[name] = block
+        for name, (blockname, shape, dtype) in spec.items():
+            if name not in self.blocks:
+                self.blocks[name] = shared_memory.SharedMemory(blockname)
+            self.arrays[name] = np.ndarray(shape, dtype=dtype,
+                                           buffer=self.blocks[name].buf)
+        if arrays is not None:
+            for name, a in arrays.items():
+                self.arrays[name][...] = a
+        self._spec = spec
+
+    def spec(self):
+        """Names, shapes and dtypes to attach the arrays elsewhere."""
+        return self._spec
+
+    def close(self):
+        """Detach the arrays, the creating process also frees them."""
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+
+def getWeights(shared, nlayers):
+    """Weights and biases of a network from shared arrays."""
+    return ([shared.arrays["w%d" % i] for i in range(nlayers)],
+            [shared.arrays["b%d" % i] for i in range(nlayers)])
+
+
+def getPixelFile(pixels):
+    """File of memory-mapped pixels, None if they are not a whole .npy file.
+
+    Parameters
+    ----------
+    pixels : ndarray
+        Pixels of a dataloader.CrossSet
+
+    Returns
+    -------
+    path : str or None
+        File that np.load maps to the same array
+
+    """
+    path = getattr(pixels, "filename", None)
+    if path is None or not str(path).endswith(".npy"):
+        return None
+    # a slice of the mapped file keeps its name
+    mapped = np.load(path, mmap_mode="r")
+    if mapped.shape != pixels.shape or mapped.offset != pixels.offset:
+        return None
+    return path
+
+
+def initWorker(spec, pixels, labels, sizes, mode):
+    """Attach the training data and the weights in a worker process.
+
+    Parameters
+    ----------
+    spec : dict
+        Shared arrays, see SharedArrays.spec
+    pixels : str or None
+        File of the memory-mapped pixels (see dataloader.loadcache), None
+        if they are in the shared arrays
+    labels : ndarray
+        Labels of all rows of the pixels
+    sizes : list
+        Layers of the network
+    mode : str
+        "sync" trains a private copy of the weights, "hogwild" updates the
+        shared weights directly
+
+    """
+    shared = SharedArrays(spec=spec)
+    weights, biases = getWeights(shared, len(sizes) - 1)
+    if mode == "sync":
+        weights = [w.copy() for w in weights]
+        biases = [b.copy() for b in biases]
+    if pixels is None:
+        pixels = shared.arrays["pixels"]
+    else:
+        # the page cache of the file is shared by all workers
+        pixels = np.load(pixels, mmap_mode="r")
+    _worker["shared"] = shared
+    _worker["network"] = nn.Network(sizes, weights, biases)
+    _worker["data"] = dl.CrossSet(pixels, labels, np.arange(len(labels)))
+
+
+def trainRound(args):
+    """Train mini batches on a private copy of the shared weights.
+
+    Parameters
+    ----------
+    args : tuple
+        Rows of the boxes of each mini batch (list of ndarray) and the
+        learning rate
+
+    Returns
+    -------
+    deltas : list of ndarray
+        Change of every weight and bias array
+
+    """
+    batches, eta = args
+    network = _worker["network"]
+    weights, biases = getWeights(_worker["shared"], network.num_layers - 1)
+    for a, shared in zip(network.weights + network.biases,
+                         weights + biases):
+        a[...] = shared
+    start = [a.copy() for a in network.weights + network.biases]
+    for rows in batches:
+        x, y = _worker["data"].matrices(rows)
+        network.update_batch(x, y, eta)
+    return [a - a0 for a, a0 in zip(network.weights + network.biases,
+                                    start)]
+
+
+def trainHogwild(args):
+    """Train mini batches directly on the shared weights, without locks.
+
+    Parameters
+    ----------
+    args : tuple
+        Rows of the boxes of each mini batch (list of ndarray) and the
+        learning rate
+
+    Returns
+    -------
+    n : int
+        Number of trained mini batches
+
+    """
+    batches, eta = args
+    network = _worker["network"]
+    for rows in batches:
+        x, y = _worker["data"].matrices(rows)
+        network.update_batch(x, y, eta)
+    return len(batches)
+
+
+def SGD(network, training_data, test_data=None, workers=2, mode="sync",
+        syncEvery=1, seed=1, checkpoint=None, resume=False, patience=None,
+        minDelta=0., schedule=None, sample=None):
+    """Stochastic gradient descent with several worker processes.
+
+    The mini batches of every epoch are distributed over the workers. In
+    "sync" mode, every worker trains syncEvery mini batches on the same
+    weights, then the changes are averaged in a fixed order, so the result
+    does not depend on the timing of the workers. syncEvery=1 averages
+    the gradients of one mini batch per worker. In "hogwild" mode, every
+    worker updates the shared weights without any locks, which is faster
+    but not reproducible.
+
+    Only the weights are copied into shared memory. The workers map the
+    cached pixels of the training data from disk, see dataloader.loadcache.
+
+    Parameters
+    ----------
+    network : evalhelper_nn.Network
+        Network to be trained, its weights are updated in place
+    training_data : dataloader.CrossSet
+        Data to train the network
+    test_data : list of tuples or dataloader.CrossSet, optional
+        Data to evaluate the network after each epoch
+    workers : int, optional
+        Number of worker processes
+    mode : str, optional
+        "sync" or "hogwild"
+    syncEvery : int, optional
+        Mini batches per worker between two synchronizations ("sync")
+    seed : int, optional
+        Seed of the order of the mini batches
+    checkpoint, resume, patience, minDelta, schedule, sample : optional
+        See evalhelper_nn.Network.SGD
+
+    Returns
+    -------
+    history : list of float
+        Test accuracy after every epoch
+
+    """
+    if mode not in ["sync", "hogwild"]:
+        raise ValueError("Unknown mode: " + mode)
+    nlayers = network.num_layers - 1
+    arrays = {}
+    for i, (w, b) in enumerate(zip(network.weights, network.biases)):
+        arrays["w%d" % i] = w
+        arrays["b%d" % i] = b
+    # pixels of the cache are mapped from the file by every worker
+    pixels = getPixelFile(training_data.pixels)
+    if pixels is None:
+        arrays["pixels"] = np.asarray(training_data.pixels)
+    shared = SharedArrays(arrays)
+    pool = None
+    weights, biases = network.weights, network.biases
+
+    def trainEpoch(j, eta):
+        n = len(training_data)
+        batchsize = network.mini_batchsize
+        order = np.random.RandomState(seed + j).permutation(n)
+        batches = [training_data.indices[order[k:k+batchsize]]
+                   for k in range(0, n, batchsize)]
+        if mode == "hogwild":
+            # contiguous part of the epoch per worker
+            parts = np.array_split(np.arange(len(batches)), workers)
+            pool.map(trainHogwild,
+                     [([batches[k] for k in p], eta) for p in parts])
+            return
+        step = workers * syncEvery
+        for r in range(0, len(batches), step):
+            rounds = [(batches[r+k:r+k+syncEvery], eta)
+                      for k in range(0, step, syncEvery)]
+            deltas = pool.map(trainRound, [b for b in rounds if b[0]])
+            # average in the order of the workers
+            for a, changes in zip(network.weights + network.biases,
+                                  zip(*deltas)):
+                a += sum(changes) / float(len(deltas))
+
+    try:
+        pool = multiprocessing.Pool(workers, initializer=initWorker,
+                                    initargs=(shared.spec(), pixels,
+                                              np.asarray(training_data.labels),
+                                              network.sizes, mode))
+        # the network of the main process sees the shared weights
+        network.weights, network.biases = getWeights(shared, nlayers)
+        return nn.trainEpochs(network, trainEpoch, test_data, checkpoint,
+                              resume, patience, minDelta, schedule, sample)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        # copy the weights out of shared memory before it is freed
+        for a, trained in zip(weights + biases,
+                              network.weights + network.biases):
+            a[...] = trained
+        network.weights, network.biases = weights, biases
+        shared.close()
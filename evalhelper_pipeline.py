@@ -0,0 +1,66 @@
+"""Evaluation helper - scan to answers pipeline in memory."""
+import numpy as np
+
+# Own scripts
+import bogen
+
+
+def answersFromBoxes(evalnn, bogendata):
+    """Get the crossed answer of each question.
+
+    Parameters
+    ----------
+    evalnn : evalhelper_nn.Network
+        Trained neural network
+    bogendata : ndarray
+        All 14 questions with 5 boxes each, shape (14, 5, 1600), or several
+        boegen at once, shape (nboegen, 14, 5, 1600)
+
+    Returns
+    -------
+    summary : ndarray
+        Crossed answer (0-4) of each question, 0 if none is crossed, shape
+        (14,) or (nboegen, 14)
+
+    """
+    # see if the boxes are crossed or not, all boxes in one batch
+    evaluated = evalnn.predict_batch(bogendata.reshape(-1, 1600))
+    evaluated = evaluated.reshape(bogendata.shape[:-1])
+
+    # summary -> which of the boxes to one question is crossed
+    # -> number between 0-4
+    return np.argmax(evaluated, axis=-1)
+
+
+def evaluateScan(curr_file, ref_points, ref_boxes, evalnn, saveBoxes=False,
+                 **options):
+    """Evaluate a scanned bogen without writing the boxes to disk.
+
+    Parameters
+    ----------
+    curr_file : str
+        Path to the bogen
+    ref_points : list of lists
+        Reference points of the reference file
+    ref_boxes : dict
+        Positions of all boxes of the reference file
+    evalnn : evalhelper_nn.Network
+        Trained neural network
+    saveBoxes : bool, optional
+        Additionally write the boxes as PNGs (for debugging)
+    **options
+        Further keyword arguments passed to bogen.Bogen
+
+    Returns
+    -------
+    summary : ndarray
+        Crossed answer (0-4) of each question, None if the bogen was
+        rejected (see maxResidual of bogen.Bogen)
+
+    """
+    curr_bogen = bogen.Bogen(curr_file=curr_file, ref_points=ref_points,
+                             ref_boxes=ref_boxes, isReference=False,
+                             saveBoxes=saveBoxes, **options)
+    if curr_bogen.Rejected:
+        return None
+    return answersFromBoxes(evalnn, curr_bogen.BoxData)
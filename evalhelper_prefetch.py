@@ -0,0 +1,79 @@
+"""Evaluation helper - background loading of pages and boxes."""
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Own scripts
+import evalhelper_instrumentation as ins
+
+
+class Prefetcher(object):
+    """Load the next items in background threads while one is processed."""
+
+    def __init__(self, func, items, depth=2, workers=None):
+        """Initialize prefetcher.
+
+        Parameters
+        ----------
+        func : callable
+            Loads one item, e.g. bogen.loadPage
+        items : list
+            Arguments of func, e.g. paths
+        depth : int, optional
+            Number of items loaded in advance, 0 loads in the consumer
+        workers : int, optional
+            Number of threads, default is depth
+
+        """
+        self.func = func
+        self.items = list(items)
+        self.depth = depth
+        self.workers = workers or depth
+
+        # time the consumer waited for loaded items
+        self.waited = 0.
+        self.loaded = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        """Yield (item, loaded item) in the order of the items."""
+        if self.depth < 1:
+            for item in self.items:
+                start = time.perf_counter()
+                result = self.func(item)
+                self.addWait(time.perf_counter() - start)
+                yield item, result
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = collections.deque()
+        try:
+            for i, item in enumerate(self.items):
+                # keep depth items in flight besides the current one
+                while len(pending) <= self.depth and (
+                        i + len(pending) < len(self.items)):
+                    nextitem = self.items[i + len(pending)]
+                    pending.append(executor.submit(self.func, nextitem))
+                start = time.perf_counter()
+                result = pending.popleft().result()
+                self.addWait(time.perf_counter() - start)
+                yield item, result
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def addWait(self, seconds):
+        """Record the time the consumer waited for an item."""
+        self.waited += seconds
+        self.loaded += 1
+        ins.addTime("prefetch_wait", seconds)
+
+    def report(self):
+        """Print how long the consumer waited for loading."""
+        if self.loaded:
+            print("Waited", round(self.waited, 2), "s for loading (",
+                  round(self.waited / self.loaded * 1000, 1), "ms per item,",
+                  "prefetch depth", self.depth, ")")
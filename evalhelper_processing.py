@@ -0,0 +1,467 @@
+"""Evaluation helper - batch processing of boegen."""
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+
+# Own scripts
+import bogen
+import evalhelper_instrumentation as ins
+import evalhelper_prefetch as pf
+
+# reference of the worker processes, set once by initWorker
+_reference = {}
+
+# default location of the manifest of processed boegen
+MANIFEST = "boxes/manifest.json"
+
+# default location of the analysed reference bogen
+REFERENCE = "boxes/reference.json"
+
+# default location of the results of all boegen, see saveResults
+RESULTS = "boxes/results.json"
+
+
+def fileHash(path):
+    """SHA1 of the content of a file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file
+
+    Returns
+    -------
+    str
+        Hex digest
+
+    """
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def getLayoutVersion(reference_file, options=None,
+                     layout="reference_positions.csv", maskdir="masks",
+                     maskpos="mask_positions.csv"):
+    """Version of everything besides the bogen that changes its boxes.
+
+    Parameters
+    ----------
+    reference_file : str
+        Path to the reference bogen
+    options : dict, optional
+        Keyword arguments passed to every Bogen
+    layout : str, optional
+        Box positions of the reference
+    maskdir : str, optional
+        Folder of the masks
+    maskpos : str, optional
+        Search windows of the masks
+
+    Returns
+    -------
+    str
+        Hex digest of reference, layout, masks and options
+
+    """
+    sha = hashlib.sha1()
+    masks = sorted(os.path.join(maskdir, f) for f in os.listdir(maskdir))
+    for path in [reference_file, layout, maskpos] + masks:
+        sha.update((path + fileHash(path)).encode())
+    sha.update(json.dumps(options or {}, sort_keys=True).encode())
+    return sha.hexdigest()
+
+
+def loadReference(reference_file, options=None, path=REFERENCE):
+    """Get reference points and box positions, cached on disk.
+
+    The reference bogen is only analysed again if the reference bogen, the
+    masks, the box positions or the search options changed.
+
+    Parameters
+    ----------
+    reference_file : str
+        Path to the reference bogen
+    options : dict, optional
+        Keyword arguments passed to every Bogen
+    path : str, optional
+        JSON file of the cache
+
+    Returns
+    -------
+    (ref_points, ref_boxes) : tuple
+        Reference points and positions of all boxes of the reference
+
+    """
+    options = options or {}
+    # only the mask search influences the reference points
+    search = {k: options[k] for k in ["method", "searchMargin"]
+              if k in options}
+    version = getLayoutVersion(reference_file, search)
+    if os.path.exists(path):
+        with ins.timer("reference_load"):
+            with open(path) as f:
+                data = json.load(f)
+        if data.get("version") == version:
+            return data["points"], data["boxes"]
+
+    referenceBogen = bogen.Bogen(curr_file=reference_file, ref_points=None,
+                                 ref_boxes=None, isReference=True, **options)
+    ref_points = [[int(v) for v in p] for p in referenceBogen.ReferencePoints]
+    ref_boxes = referenceBogen.ReferenceBoxes
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": version, "points": ref_points,
+                   "boxes": ref_boxes}, f)
+    os.replace(path + ".tmp", path)
+    return ref_points, ref_boxes
+
+
+class Manifest(object):
+    """Record of processed boegen, to skip unchanged ones."""
+
+    def __init__(self, layoutVersion, path=MANIFEST):
+        """Load the manifest, entries of another layout are dropped.
+
+        Parameters
+        ----------
+        layoutVersion : str
+            Current version, see getLayoutVersion
+        path : str, optional
+            JSON file of the manifest
+
+        """
+        self.path = path
+        self.layoutVersion = layoutVersion
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("layout") == layoutVersion:
+                self.files = data["files"]
+
+    def getPending(self, files):
+        """Get the boegen that are new or changed.
+
+        Size and modification time are checked first, the content hash
+        only if they changed. Accepted boegen whose boxes are missing are
+        processed again, rejected ones have no boxes.
+
+        Parameters
+        ----------
+        files : list of str
+            Paths to the boegen
+
+        Returns
+        -------
+        pending : list of str
+            Paths that need to be processed
+
+        """
+        pending = []
+        for path in files:
+            entry = self.files.get(path)
+            if entry is None or (not entry["rejected"] and
+                                 not os.path.exists(entry["outputDir"])):
+                pending.append(path)
+                continue
+            stat = os.stat(path)
+            if (entry["size"], entry["mtime"]) == (stat.st_size,
+                                                   stat.st_mtime_ns):
+                continue
+            if fileHash(path) != entry["hash"]:
+                pending.append(path)
+            else:
+                entry["mtime"] = stat.st_mtime_ns
+        return pending
+
+    def update(self, result):
+        """Record a processed bogen.
+
+        Parameters
+        ----------
+        result : dict
+            Result of processFile
+
+        """
+        stat = os.stat(result["file"])
+        self.files[result["file"]] = {
+            "hash": fileHash(result["file"]),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "outputDir": result["outputDir"],
+            "rejected": result["rejected"],
+            "scores": result["scores"],
+            "residuals": result["residuals"]}
+
+    def save(self):
+        """Write the manifest to its JSON file."""
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"layout": self.layoutVersion, "files": self.files},
+                      f, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def parseShard(shard):
+    """Parse a shard given as "i/N".
+
+    Parameters
+    ----------
+    shard : str
+        Shard i (1 to N) of N shards
+
+    Returns
+    -------
+    (i, N) : tuple of int
+
+    """
+    i, nshards = [int(v) for v in shard.split("/")]
+    if not 1 <= i <= nshards:
+        raise ValueError("Shard must be between 1/N and N/N: " + shard)
+    return i, nshards
+
+
+def getShard(curr_file, nshards):
+    """Stable shard of a bogen, depends only on its file name.
+
+    Parameters
+    ----------
+    curr_file : str
+        Path to the bogen
+    nshards : int
+        Number of shards
+
+    Returns
+    -------
+    shard : int
+        Shard between 1 and nshards
+
+    """
+    name = os.path.basename(curr_file).encode()
+    return int(hashlib.sha1(name).hexdigest(), 16) % nshards + 1
+
+
+def getShardPath(path, shard, nshards):
+    """Path of the file of a shard, e.g. boxes/results_1of4.json.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file without shards, e.g. RESULTS or MANIFEST
+    shard, nshards : int
+        Shard i of N shards
+
+    Returns
+    -------
+    str
+        Path of the file of the shard
+
+    """
+    root, ext = os.path.splitext(path)
+    return "%s_%dof%d%s" % (root, shard, nshards, ext)
+
+
+def saveResults(files, manifest, path=RESULTS, shard=None):
+    """Save the results of boegen, e.g. of one shard.
+
+    Parameters
+    ----------
+    files : list of str
+        Paths to the boegen, all of them need to be in the manifest
+    manifest : Manifest
+        Results of the processed boegen
+    path : str, optional
+        JSON file
+    shard : tuple of int, optional
+        Shard (i, N) of the boegen
+
+    """
+    data = {"layout": manifest.layoutVersion, "shard": shard,
+            "boegen": {f: manifest.files[f] for f in sorted(files)}}
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def mergeResults(paths, path=RESULTS):
+    """Merge the results of all shards into one file.
+
+    Parameters
+    ----------
+    paths : list of str
+        JSON files of the shards, see saveResults
+    path : str, optional
+        JSON file of the merged results
+
+    Returns
+    -------
+    merged : dict
+        Results of all boegen
+
+    """
+    shards = []
+    for shardpath in paths:
+        with open(shardpath) as f:
+            shards.append(json.load(f))
+    if not shards or any(s["shard"] is None for s in shards):
+        raise ValueError("No results of shards to merge.")
+
+    # all shards of the same run, each one exactly once
+    nshards = shards[0]["shard"][1]
+    if (len(set(s["layout"] for s in shards)) != 1 or
+            sorted(s["shard"][0] for s in shards) != list(
+                range(1, nshards + 1)) or
+            any(s["shard"][1] != nshards for s in shards)):
+        raise ValueError("Results of different runs or missing shards.")
+
+    merged = {"layout": shards[0]["layout"], "shard": None, "boegen": {}}
+    names = set()
+    for s in shards:
+        for curr_file, entry in s["boegen"].items():
+            name = os.path.basename(curr_file)
+            if name in names:
+                raise ValueError("Bogen in more than one shard: " + name)
+            names.add(name)
+            merged["boegen"][curr_file] = entry
+
+    with open(path + ".tmp", "w") as f:
+        json.dump(merged, f, indent=1)
+    os.replace(path + ".tmp", path)
+    return merged
+
+
+def initWorker(ref_points, ref_boxes, options=None, instrumentation=None,
+               maxPages=None):
+    """Store the reference in a worker process.
+
+    Parameters
+    ----------
+    ref_points : list of lists
+        Reference points of the reference file
+    ref_boxes : dict
+        Positions of all boxes of the reference file
+    options : dict, optional
+        Keyword arguments passed to every Bogen
+    instrumentation : dict, optional
+        Settings to enable timers, see instrumentation.getSettings
+    maxPages : int, optional
+        Decoded pages resident at once in the process, see bogen.PageBudget
+
+    """
+    if instrumentation is not None and not ins.isEnabled():
+        ins.enable(**instrumentation)
+    bogen.setPageBudget(maxPages)
+    _reference["points"] = ref_points
+    _reference["boxes"] = ref_boxes
+    _reference["options"] = options or {}
+
+
+def processFile(curr_file, page=None):
+    """Process a single bogen: mask search, transformation and boxes.
+
+    Parameters
+    ----------
+    curr_file : str
+        Path to the bogen
+    page : ndarray, optional
+        Page decoded in advance, see bogen.loadPage
+
+    Returns
+    -------
+    result : dict
+        Processed file, folder of its boxes, match confidence of the masks,
+        residuals of the reference points and whether it was rejected
+
+    """
+    curr_bogen = bogen.Bogen(curr_file=curr_file,
+                             ref_points=_reference["points"],
+                             ref_boxes=_reference["boxes"],
+                             isReference=False, page=page,
+                             **_reference["options"])
+    return {"file": curr_file,
+            "outputDir": curr_bogen.outputDir,
+            "scores": curr_bogen.MatchScores,
+            "residuals": [float(r) for r in curr_bogen.Residuals],
+            "rejected": curr_bogen.Rejected}
+
+
+def processFiles(files, ref_points, ref_boxes, workers=1, options=None,
+                 manifest=None, maxPages=None, prefetch=2):
+    """Process boegen, optionally in a pool of worker processes.
+
+    Parameters
+    ----------
+    files : list of str
+        Paths to the boegen
+    ref_points : list of lists
+        Reference points of the reference file
+    ref_boxes : dict
+        Positions of all boxes of the reference file
+    workers : int, optional
+        Number of worker processes, 1 processes in the current process
+    options : dict, optional
+        Keyword arguments passed to every Bogen
+    manifest : Manifest, optional
+        Updated with every processed bogen and saved regularly
+    maxPages : int, optional
+        Decoded pages resident at once per process, see bogen.PageBudget
+    prefetch : int, optional
+        Pages decoded in advance in background threads (only without
+        worker processes, they already overlap decoding and processing)
+
+    Returns
+    -------
+    results : list of dict
+        Result of processFile for every file, in the order of `files`
+
+    """
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=initWorker,
+                                    initargs=(ref_points, ref_boxes, options,
+                                              ins.getSettings(), maxPages))
+        processed = pool.imap(processFile, files)
+    else:
+        pool = None
+        initWorker(ref_points, ref_boxes, options, maxPages=maxPages)
+        # prefetched pages count against the budget, one is processed
+        if maxPages is not None:
+            prefetch = min(prefetch, maxPages - 1)
+        prefetcher = pf.Prefetcher(bogen.loadPage, files, prefetch)
+        processed = (processFile(f, page) for f, page in prefetcher)
+
+    results = []
+    start = time.time()
+    try:
+        for i, result in enumerate(processed):
+            results.append(result)
+            if manifest is not None:
+                manifest.update(result)
+                if (i + 1) % 50 == 0:
+                    manifest.save()
+            # show progress
+            elapsed = time.time() - start
+            eta = elapsed / (i + 1) * (len(files) - i - 1)
+            print("Progress: ", round((i + 1) / len(files) * 100, 2),
+                  "( ETA", round(eta, 1), "s,", result["file"],
+                  ", confidence", round(min(result["scores"]), 3),
+                  ", residual", round(max(result["residuals"]), 2), ")")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if manifest is not None:
+            manifest.save()
+
+    if pool is None:
+        prefetcher.report()
+    return results
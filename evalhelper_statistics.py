@@ -19,6 +19,9 @@ def printStats(summary):
         just printing of results
 
     """
+    if len(summary) == 0:
+        print("\n\n###\nBoegen - Evaluation\n###\nNo data.")
+        return
     # storage -> 14x5 as 14 questions and 5 answers each
     stats = np.zeros(shape=(14, 5), dtype=float)
     # loop through all
@@ -26,7 +29,8 @@ def printStats(summary):
         for acounter in range(5):
             # count non_zeros equal to 0-4 in each column (ie all rows)
             stats[qcounter][acounter] = round(np.count_nonzero(
-                summary[:, qcounter] == acounter) / float(28) * 100, 2)
+                summary[:, qcounter] == acounter) / float(len(summary)) * 100,
+                2)
     # print stats
     print("\n\n###\nBoegen - Evaluation\n###")
     print("Q\t1\t2\t3\t4\t5\t|  Mean")
@@ -55,3 +59,31 @@ def getAverage(question):
     for i, a in enumerate(question):
         av += (i+1) * a / 100
     return av
+
+
+def printMetrics(metrics):
+    """ Print the evaluation of the neural network on test data.
+
+    Parameters
+    ----------
+    metrics : dict
+        evaluation results, see evalhelper_nn.Network.evaluateMetrics
+
+    Returns
+    -------
+    None : None
+        just printing of results
+
+    """
+    print("\n###\nNeural network - Test data\n###")
+    print("Correct:", metrics["correct"], "from", metrics["n"], "->",
+          round(metrics["accuracy"]*100, 2), "%")
+    print("Class\tPredicted\t\t|  Precision\tRecall")
+    for i, row in enumerate(metrics["confusion"]):
+        print("%d\t%s\t|  %.2f\t\t%.2f" %
+              (i, "\t".join("%d" % c for c in row),
+               metrics["precision"][i]*100, metrics["recall"][i]*100))
+    print("Score of class %d:" % (len(metrics["confusion"]) - 1))
+    edges = metrics["edges"]
+    for i, count in enumerate(metrics["histogram"]):
+        print("%.1f-%.1f\t%d" % (edges[i], edges[i+1], count))
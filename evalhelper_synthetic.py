@@ -0,0 +1,318 @@
+"""Evaluation helper - synthetic boegen for load tests."""
+import os
+import csv
+import json
+import shutil
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# Own scripts
+import evalhelper_geometry as gm
+
+# positions [x,y] of the corner masks, inside the search windows of
+# mask_positions.csv
+MASKS = {"ul": (70, 690), "um": (1110, 385), "ur": (2350, 390),
+         "ll": (70, 2755), "lr": (2350, 2750)}
+
+# size of the scanned pages
+PAGESIZE = (2479, 2829)
+
+
+def loadPositions(path="reference_positions.csv"):
+    """Load the box positions of the layout.
+
+    Parameters
+    ----------
+    path : str, optional
+        Tab separated file, see bogen.Bogen.getRefPositions
+
+    Returns
+    -------
+    posdict : dict
+        Lists of x0, x1, y0, y1 of all boxes
+
+    """
+    posdict = {}
+    with open(path) as posfile:
+        reader = csv.DictReader(posfile, delimiter="\t",
+                                skipinitialspace=True)
+        for row in reader:
+            for c in ["x0", "x1", "y0", "y1"]:
+                posdict.setdefault(c, []).append(int(row[c]))
+    return posdict
+
+
+def drawCross(draw, box, rng):
+    """Draw a slightly irregular cross into a box.
+
+    Parameters
+    ----------
+    draw : ImageDraw
+        Drawing context of the page
+    box : list of float
+        Corners [x0, y0, x1, y1] of the box
+    rng : numpy.random.RandomState
+        Random generator
+
+    """
+    x0, y0, x1, y1 = box
+    jitter = rng.randint(-3, 4, 8)
+    width = rng.randint(2, 6)
+    draw.line([x0+5+jitter[0], y0+5+jitter[1], x1-5+jitter[2],
+               y1-5+jitter[3]], fill=0, width=width)
+    draw.line([x0+5+jitter[4], y1-5+jitter[5], x1-5+jitter[6],
+               y0+5+jitter[7]], fill=0, width=width)
+
+
+def renderPage(boxes, answers, rng):
+    """Render an undistorted bogen.
+
+    Parameters
+    ----------
+    boxes : dict
+        Positions of all boxes, see loadPositions
+    answers : list of int
+        Crossed answer (0-4) of each question
+    rng : numpy.random.RandomState
+        Random generator
+
+    Returns
+    -------
+    page : image
+        Greyscale image of size PAGESIZE
+
+    """
+    page = Image.new("L", PAGESIZE, 255)
+    draw = ImageDraw.Draw(page)
+
+    # corner masks, a black square with a white hole
+    for x, y in MASKS.values():
+        draw.rectangle([x+5, y+5, x+30, y+30], fill=0)
+        draw.rectangle([x+12, y+12, x+22, y+22], fill=255)
+
+    # all boxes and one cross per question
+    for i in range(len(boxes["x0"])):
+        draw.rectangle([boxes["x0"][i], boxes["y0"][i], boxes["x1"][i],
+                        boxes["y1"][i]], outline=0, width=2)
+    for q, answer in enumerate(answers):
+        i = 5*q + answer
+        drawCross(draw, [boxes["x0"][i], boxes["y0"][i], boxes["x1"][i],
+                         boxes["y1"][i]], rng)
+    return page
+
+
+def randomAffine(rng, rotation=0.3, scale=0.003, shift=8.):
+    """Random affine transformation around the page center.
+
+    Parameters
+    ----------
+    rng : numpy.random.RandomState
+        Random generator
+    rotation : float, optional
+        Maximum rotation in degrees
+    scale : float, optional
+        Maximum relative change of the scale
+    shift : float, optional
+        Maximum shift in pixels
+
+    Returns
+    -------
+    transMatrix : ndarray
+        Matrix A (row by row) and vector b, scan = A * reference + b
+
+    """
+    angle = np.deg2rad(rng.uniform(-rotation, rotation))
+    factor = 1. + rng.uniform(-scale, scale)
+    A = factor * np.array([[np.cos(angle), -np.sin(angle)],
+                           [np.sin(angle), np.cos(angle)]])
+    center = np.array(PAGESIZE) / 2.
+    b = center - np.dot(A, center) + rng.uniform(-shift, shift, 2)
+    return np.concatenate([A.ravel(), b])
+
+
+def distortPage(page, transMatrix, rng, noise=6., blur=0.6):
+    """Apply an affine transformation and scanner noise to a page.
+
+    Parameters
+    ----------
+    page : image
+        Undistorted page
+    transMatrix : ndarray
+        Matrix A and vector b, see randomAffine
+    rng : numpy.random.RandomState
+        Random generator
+    noise : float, optional
+        Standard deviation of the gaussian noise
+    blur : float, optional
+        Radius of the gaussian blur
+
+    Returns
+    -------
+    page : image
+        Distorted page
+
+    """
+    # PIL maps output to input pixels -> inverse transformation
+    A = transMatrix[:4].reshape(2, 2)
+    b = transMatrix[4:]
+    Ainv = np.linalg.inv(A)
+    binv = -np.dot(Ainv, b)
+    page = page.transform(PAGESIZE, Image.AFFINE,
+                          tuple(np.concatenate([Ainv[0], [binv[0]],
+                                                Ainv[1], [binv[1]]])),
+                          resample=Image.BILINEAR, fillcolor=255)
+    page = page.filter(ImageFilter.GaussianBlur(blur))
+
+    # uneven brightness and noise of the scanner
+    pixels = np.asarray(page, dtype=float) * rng.uniform(0.9, 1.)
+    pixels += rng.normal(0, noise, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def getTrueBoxes(boxes, transMatrix):
+    """Box positions on a distorted page.
+
+    Parameters
+    ----------
+    boxes : dict
+        Positions of all boxes of the reference
+    transMatrix : ndarray
+        Matrix A and vector b of the distortion
+
+    Returns
+    -------
+    truth : dict
+        Transformed lists of x0, y0, x1, y1
+
+    """
+    n = len(boxes["x0"])
+    points = np.column_stack([boxes["x0"] + boxes["x1"],
+                              boxes["y0"] + boxes["y1"]])
+    points = gm.transformPoints(transMatrix, points)
+    return {"x0": list(points[:n, 0]), "y0": list(points[:n, 1]),
+            "x1": list(points[n:, 0]), "y1": list(points[n:, 1])}
+
+
+def getBoxErrors(curr_bogen, layout, transMatrix):
+    """Distance between extracted and true box corners of a bogen.
+
+    Parameters
+    ----------
+    curr_bogen : bogen.Bogen
+        Processed bogen
+    layout : dict
+        Positions of all boxes of the reference, "layout" of truth.json
+    transMatrix : list of float
+        True distortion of the bogen, see truth.json
+
+    Returns
+    -------
+    errors : ndarray
+        Maximum corner error of every box in pixels
+
+    """
+    true_boxes = getTrueBoxes(layout, np.array(transMatrix))
+    diff = np.array([np.subtract(curr_bogen.CurrBoxes[c], true_boxes[c])
+                     for c in ["x0", "y0", "x1", "y1"]])
+    return np.max(np.abs(diff), axis=0)
+
+
+def renderCrosses(folder, nsamples, rng, ratio=0.25):
+    """Write crossed and empty training boxes like 01_process_files.py.
+
+    Parameters
+    ----------
+    folder : str
+        Folder that gets work_type_crossed/ and work_type_empty/
+    nsamples : int
+        Number of boxes
+    rng : numpy.random.RandomState
+        Random generator
+    ratio : float, optional
+        Share of crossed boxes
+
+    """
+    for kind in ["crossed", "empty"]:
+        os.makedirs(os.path.join(folder, "work_type_" + kind), exist_ok=True)
+    for k in range(nsamples):
+        box = Image.new("L", (60, 60), 255)
+        draw = ImageDraw.Draw(box)
+        draw.rectangle([10, 10, 50, 50], outline=0, width=2)
+        crossed = rng.uniform() < ratio
+        if crossed:
+            drawCross(draw, [10, 10, 50, 50], rng)
+        box = np.asarray(box.resize((40, 40)), dtype=float)
+        box = np.clip(box + rng.normal(0, 10, box.shape), 0, 255)
+        Image.fromarray(box.astype(np.uint8)).save(os.path.join(
+            folder, "work_type_" + ("crossed" if crossed else "empty"),
+            "%d.png" % k))
+
+
+def generate(folder, nforms, nsamples=0, seed=1,
+             layout="reference_positions.csv", maskpos="mask_positions.csv"):
+    """Generate synthetic boegen with ground truth.
+
+    Creates boegen/ (with the undistorted reference Bogen3.jpg), masks/,
+    copies of the layout and the mask positions, truth.json with the
+    answers and distortion of every bogen, and optionally crosses/ with
+    training boxes. Run the scripts inside the folder.
+
+    Parameters
+    ----------
+    folder : str
+        Output folder
+    nforms : int
+        Number of distorted boegen
+    nsamples : int, optional
+        Number of training boxes in crosses/
+    seed : int, optional
+        Seed of the random generator
+    layout : str, optional
+        Box positions of the reference
+    maskpos : str, optional
+        Search windows of the masks
+
+    Returns
+    -------
+    truth : dict
+        Ground truth, "layout" with the box positions and "boegen" with
+        the answers and distortion of every bogen (by path)
+
+    """
+    rng = np.random.RandomState(seed)
+    for sub in ["boegen", "masks"]:
+        os.makedirs(os.path.join(folder, sub), exist_ok=True)
+    shutil.copy(layout, os.path.join(folder, "reference_positions.csv"))
+    shutil.copy(maskpos, os.path.join(folder, "mask_positions.csv"))
+    boxes = loadPositions(layout)
+    nquestions = (len(boxes["x0"]) - 4) // 5
+    truth = {"layout": boxes, "boegen": {}}
+
+    # undistorted reference, the masks are cut out of it
+    answers = rng.randint(0, 5, nquestions)
+    reference = renderPage(boxes, answers, rng)
+    path = os.path.join("boegen", "Bogen3.jpg")
+    reference.save(os.path.join(folder, path))
+    truth["boegen"][path] = {"answers": [int(a) for a in answers],
+                             "transMatrix": [1., 0., 0., 1., 0., 0.]}
+    for name, (x, y) in MASKS.items():
+        reference.crop([x, y, x+40, y+40]).save(
+            os.path.join(folder, "masks", name + ".png"))
+
+    # distorted boegen, numbered around the reference
+    names = [i for i in range(1, nforms + 2) if i != 3][:nforms]
+    for i in names:
+        answers = rng.randint(0, 5, nquestions)
+        transMatrix = randomAffine(rng)
+        page = distortPage(renderPage(boxes, answers, rng), transMatrix, rng)
+        path = os.path.join("boegen", "Bogen%d.jpg" % i)
+        page.save(os.path.join(folder, path), quality=90)
+        truth["boegen"][path] = {"answers": [int(a) for a in answers],
+                                 "transMatrix": list(transMatrix)}
+
+    with open(os.path.join(folder, "truth.json"), "w") as f:
+        json.dump(truth, f)
+
+    if nsamples:
+        renderCrosses(os.path.join(folder, "crosses"), nsamples, rng)
+    return truth
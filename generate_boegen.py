@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+"""Evaluation helper - generate synthetic boegen for load tests."""
+
+# Standard libraries
+import argparse
+
+# Own scripts
+import evalhelper_synthetic as sy
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate synthetic boegen.")
+    parser.add_argument("-o", "--output", type=str, required=True,
+                        help="Output folder.")
+    parser.add_argument("-n", "--forms", type=int, default=100,
+                        help="Number of distorted boegen.")
+    parser.add_argument("-s", "--samples", type=int, default=0,
+                        help="Number of training boxes in crosses/.")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the random generator.")
+    parser_args = parser.parse_args()
+
+    sy.generate(parser_args.output, parser_args.forms, parser_args.samples,
+                parser_args.seed)
+    print("Generated", parser_args.forms, "boegen in", parser_args.output)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+"""Evaluation helper - merge the results of sharded processing."""
+
+# Standard libraries
+import glob
+import argparse
+
+# Own scripts
+import evalhelper_processing as pr
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Merge shard results.")
+    parser.add_argument("-i", "--input", type=str, nargs="+",
+                        default=None,
+                        help="Result files of the shards, default is "
+                        "boxes/results_*of*.json.")
+    parser.add_argument("-o", "--output", type=str, default=pr.RESULTS,
+                        help="Merged result file.")
+    parser_args = parser.parse_args()
+
+    paths = parser_args.input or sorted(glob.glob("boxes/results_*of*.json"))
+    merged = pr.mergeResults(paths, parser_args.output)
+
+    # summary of all boegen
+    boegen = merged["boegen"].values()
+    rejected = [f for f, e in merged["boegen"].items() if e["rejected"]]
+    scores = [min(e["scores"]) for e in boegen if e.get("scores")]
+    residuals = [max(e["residuals"]) for e in boegen if e.get("residuals")]
+    print("Merged", len(paths), "shards with", len(boegen), "boegen to",
+          parser_args.output)
+    if scores:
+        print("Confidence min", round(min(scores), 3), ", residual max",
+              round(max(residuals), 2))
+    if rejected:
+        print("Rejected", len(rejected), "boegen:", ", ".join(rejected))
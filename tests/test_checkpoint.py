@@ -0,0 +1,64 @@
+"""Checkpoints: an interrupted and resumed training equals a full one."""
+import os
+import numpy as np
+import pytest
+
+import evalhelper_dataloader as dl
+import evalhelper_nn as nn
+import evalhelper_parallel as par
+
+
+def getData(folder, n=400):
+    """Training and test set of random boxes, pixels mapped from a file."""
+    rng = np.random.RandomState(0)
+    path = os.path.join(str(folder), "pixels.npy")
+    np.save(path, rng.randint(0, 256, (n, 1600)).astype(np.uint8))
+    pixels = np.load(path, mmap_mode="r")
+    labels = rng.randint(0, 2, n).astype(np.uint8)
+    return (dl.CrossSet(pixels, labels, np.arange(300)),
+            dl.CrossSet(pixels, labels, np.arange(300, n)))
+
+
+def train(training_data, test_data, epochs, how, **options):
+    """Train a network with fixed initial weights."""
+    np.random.seed(0)
+    network = nn.Network([1600, 2])
+    network.epochs = epochs
+    if how == "epoch":
+        network.SGD(training_data, test_data, **options)
+    elif how == "stream":
+        network.SGD(training_data.stream(network.mini_batchsize), test_data,
+                    **options)
+    else:
+        par.SGD(network, training_data, test_data, workers=2, **options)
+    return network
+
+
+@pytest.mark.parametrize("how", ["epoch", "stream", "parallel"])
+def test_resume(tmp_path, how):
+    checkpoint = str(tmp_path / "ck.bin")
+
+    # new sets for every run, like a restarted process
+    full = train(*getData(tmp_path), 4, how)
+    train(*getData(tmp_path), 2, how, checkpoint=checkpoint)
+    resumed = train(*getData(tmp_path), 4, how, checkpoint=checkpoint,
+                    resume=True)
+    for a, b in zip(full.weights + full.biases,
+                    resumed.weights + resumed.biases):
+        assert np.array_equal(a, b)
+
+
+def test_resume_after_early_stop(tmp_path):
+    training_data, test_data = getData(tmp_path)
+    checkpoint = str(tmp_path / "ck.bin")
+
+    # random labels -> no improvement, stops early
+    stopped = train(training_data, test_data, 20, "epoch",
+                    checkpoint=checkpoint, patience=1, minDelta=1.)
+    network, state = nn.loadCheckpoint(checkpoint)
+    assert state["epoch"] == 2
+    resumed = train(training_data, test_data, 20, "epoch",
+                    checkpoint=checkpoint, resume=True, patience=1,
+                    minDelta=1.)
+    for a, b in zip(stopped.weights, resumed.weights):
+        assert np.array_equal(a, b)
@@ -0,0 +1,29 @@
+"""Box extraction and point transformation."""
+import numpy as np
+from PIL import Image
+
+import evalhelper_geometry as gm
+
+
+def test_extractBoxes_pil():
+    rng = np.random.RandomState(0)
+    page = rng.randint(0, 256, (300, 400)).astype(np.uint8)
+    # boxes of different sizes, fractional corners, one beyond the page
+    corners = [[10, 20, 58, 66], [100.4, 50.6, 141.2, 92.7],
+               [200, 200, 236, 238], [370, 280, 420, 330],
+               [50, 100, 90, 140]]
+
+    boxes = gm.extractBoxes(page, corners)
+    image = Image.fromarray(page)
+    for box, c in zip(boxes, corners):
+        expected = image.crop([int(round(v)) for v in c]).resize(
+            (40, 40), Image.BICUBIC)
+        assert np.array_equal(box, np.asarray(expected))
+
+
+def test_transformPoints():
+    points = np.array([[0., 0.], [10., 5.], [-3., 7.]])
+    transMatrix = np.array([1.1, 0.2, -0.1, 0.9, 5., -2.])
+    A = transMatrix[:4].reshape(2, 2)
+    expected = [np.dot(A, p) + transMatrix[4:] for p in points]
+    assert np.allclose(gm.transformPoints(transMatrix, points), expected)
@@ -0,0 +1,46 @@
+"""Vectorized template matching against the pixel by pixel search."""
+import numpy as np
+import pytest
+
+import bogen
+import evalhelper_matching as mt
+
+
+def getForm(page):
+    """Bogen with a page only, without analysing a file."""
+    form = bogen.Bogen.__new__(bogen.Bogen)
+    form.pageArray = page
+    return form
+
+
+@pytest.mark.parametrize("x1, x2, y1, y2", [
+    (20, 45, 30, 50),
+    # candidates partly outside of the page -> zero filled like PIL
+    (100, 112, 70, 84),
+])
+def test_matchTemplate_bruteforce(x1, x2, y1, y2):
+    rng = np.random.RandomState(0)
+    page = rng.randint(0, 256, (120, 140)).astype(np.uint8)
+    # mask = noisy copy of a part of the page inside the window
+    mask = page[y1+3:y1+39, x1+2:x1+38].astype(int)
+    mask = np.clip(mask + rng.randint(-20, 21, mask.shape), 0, 255)
+    mask = mask.astype(np.uint8)
+
+    pos, mse = mt.matchTemplate(page, mask, x1, x2, y1, y2)
+    expected = getForm(page).findPositionBruteForce(mask, x1, x2, y1, y2,
+                                                    36, 36)
+    assert pos == expected
+
+
+def test_getSquaredErrors_exact():
+    rng = np.random.RandomState(1)
+    page = rng.randint(0, 256, (60, 70)).astype(np.uint8)
+    mask = rng.randint(0, 256, (36, 36)).astype(np.uint8)
+    x1, x2, y1, y2 = 30, 40, 20, 30
+
+    sse = mt.getSquaredErrors(page, mask, x1, x2, y1, y2)
+    window = mt.getWindow(page, x1, x2, y1, y2, 36, 36)
+    for x in range(x2 - x1):
+        for y in range(y2 - y1):
+            diff = window[y:y+36, x:x+36] - mask.astype(np.int64)
+            assert sse[x, y] == np.sum(diff**2)
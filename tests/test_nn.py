@@ -0,0 +1,57 @@
+"""Neural network: batched training against the per-sample version."""
+import numpy as np
+import pytest
+
+import evalhelper_nn as nn
+
+
+def getBatch(n, seed=0):
+    """Random boxes and labels, one column per pair."""
+    rng = np.random.RandomState(seed)
+    x = rng.randint(0, 256, (1600, n)) / 255.
+    y = np.zeros((2, n))
+    y[rng.randint(0, 2, n), np.arange(n)] = 1
+    return x, y
+
+
+def test_backprop_batch():
+    # backprop itself only supports networks without hidden layers
+    np.random.seed(0)
+    network = nn.Network([1600, 2])
+    x, y = getBatch(50)
+
+    nabla_b, nabla_w = network.backprop_batch(x, y)
+    pairs = [network.backprop(x[:, [i]], y[:, [i]]) for i in range(50)]
+    assert np.allclose(nabla_b[0], sum(b[0] for b, w in pairs))
+    assert np.allclose(nabla_w[0], sum(w[0] for b, w in pairs))
+
+
+def test_update_batch():
+    np.random.seed(0)
+    network = nn.Network([1600, 2])
+    x, y = getBatch(50)
+    weights = [w.copy() for w in network.weights]
+    biases = [b.copy() for b in network.biases]
+
+    # one SGD step as in the original update_mini_batch
+    nabla_b = [np.zeros(b.shape) for b in biases]
+    nabla_w = [np.zeros(w.shape) for w in weights]
+    for i in range(50):
+        db, dw = network.backprop(x[:, [i]], y[:, [i]])
+        nabla_b = [nb + d for nb, d in zip(nabla_b, db)]
+        nabla_w = [nw + d for nw, d in zip(nabla_w, dw)]
+    network.update_batch(x, y, 0.5)
+    for w, w0, nw in zip(network.weights, weights, nabla_w):
+        assert np.allclose(w, w0 - 0.5/50*nw)
+    for b, b0, nb in zip(network.biases, biases, nabla_b):
+        assert np.allclose(b, b0 - 0.5/50*nb)
+
+
+
+def test_SGD_iterator():
+    # an iterator of mini batches would be empty after the first epoch
+    np.random.seed(0)
+    network = nn.Network([1600, 2])
+    batches = iter([getBatch(50)])
+    with pytest.raises(TypeError):
+        network.SGD(batches)